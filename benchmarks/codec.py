@@ -0,0 +1,93 @@
+"""
+Compares the compact extended data encoding of CompactJSONField with
+the JSON text stored by the default JSONField: encoded size, and time
+to encode and decode.
+
+    python -m benchmarks.codec [--rows 20000] [--keys 50]
+"""
+
+import json
+import random
+import argparse
+from time import perf_counter
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from extensible_models import fields
+from extensible_models.fields import decode, encode
+from extensible_models.schemas import compile_schema
+
+
+def make_schema(keys):
+    types = ["string", "number", "integer", "boolean"]
+    return {
+        "type": "object",
+        "properties": {
+            f"custom_field_{i:03d}": {"type": types[i % len(types)]}
+            for i in range(keys)
+        },
+    }
+
+
+def make_document(schema, rng):
+    values = {
+        "string": lambda: rng.choice(["open", "closed", "pending review"]),
+        "number": lambda: round(rng.uniform(0, 10000), 2),
+        "integer": lambda: rng.randint(0, 100000),
+        "boolean": lambda: rng.random() < 0.5,
+    }
+    return {
+        name: values[prop["type"]]()
+        for name, prop in schema["properties"].items()
+        if rng.random() < 0.8
+    }
+
+
+def timed(function, items):
+    started = perf_counter()
+    results = [function(item) for item in items]
+    return perf_counter() - started, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    schema = make_schema(args.keys)
+    compiled = compile_schema(schema)
+    documents = [make_document(schema, rng) for _ in range(args.rows)]
+
+    def compact(codec):
+        return lambda document: encode(document, compiled, codec=codec)
+
+    codecs = [("JSONField (json text)", json.dumps, json.loads)]
+    if fields.msgpack is not None:
+        codecs.append(
+            ("CompactJSONField (msgpack)", compact(fields.CODEC_MSGPACK), decode)
+        )
+    codecs.append(("CompactJSONField (json)", compact(fields.CODEC_JSON), decode))
+
+    print(f"{args.rows} rows, {args.keys} schema keys")
+    print(f"{'encoding':<28} {'bytes/row':>10} {'encode (us)':>12} {'decode (us)':>12}")
+    for name, dumps, loads in codecs:
+        encode_time, encoded = timed(dumps, documents)
+        decode_time, decoded = timed(loads, encoded)
+        assert decoded == documents
+        size = sum(len(e) for e in encoded) / args.rows
+        print(
+            f"{name:<28} {size:10.0f} "
+            f"{encode_time / args.rows * 1e6:12.2f} "
+            f"{decode_time / args.rows * 1e6:12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Simulates multi-tenant API traffic against the tests app's models and
+reports throughput, p50/p99 latency and queries per request for the
+viewset, serializer and admin code paths.
+
+Synthetic tenants each get a number of schema versions, and rows whose
+extended data was written under a random one of them. Requests pick a
+random tenant and are served by a pool of threads, each with its own
+database connection.
+
+    python -m benchmarks.load_test [--tenants 1000] [--versions 10]
+        [--rows 5] [--requests 2000] [--concurrency 8]
+        [--paths list,retrieve,update,admin] [--resolve] [--warmup]
+        [--schema-cache-timeout 60|none] [--postgres DBNAME]
+
+By default the data lives in a temporary SQLite file. With --postgres,
+the named (empty, disposable) database is used instead, with the
+connection taken from the PGHOST, PGPORT, PGUSER and PGPASSWORD
+environment variables.
+"""
+
+import os
+import random
+import argparse
+import tempfile
+import threading
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+
+
+def configure(args):
+    if args.postgres:
+        database = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": args.postgres,
+            "HOST": os.environ.get("PGHOST", "localhost"),
+            "PORT": os.environ.get("PGPORT", ""),
+            "USER": os.environ.get("PGUSER", ""),
+            "PASSWORD": os.environ.get("PGPASSWORD", ""),
+        }
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "load_test.sqlite3")
+        database = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": path,
+            "OPTIONS": {"timeout": 30},
+        }
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "django.contrib.admin",
+            "rest_framework",
+            "extensible_models",
+            "tests",
+        ],
+        DATABASES={"default": database},
+        DEFAULT_AUTO_FIELD="django.db.models.AutoField",
+        EXTENSIBLE_MODELS_TENANT_MODEL="tests.Tenant",
+        EXTENSIBLE_MODELS_TENANT_FIELD="tenant",
+        EXTENSIBLE_MODELS_SCHEMA_CACHE_TIMEOUT=args.schema_cache_timeout,
+        REST_FRAMEWORK={
+            "DEFAULT_AUTHENTICATION_CLASSES": [],
+            "DEFAULT_PERMISSION_CLASSES": [],
+            "UNAUTHENTICATED_USER": None,
+        },
+        USE_TZ=True,
+    )
+    django.setup()
+
+
+def get_schema(version):
+    """
+    Returns the synthetic schema of a version: two fixed properties and
+    one more string property per version.
+    """
+    properties = {
+        "status": {"type": "string", "enum": ["open", "closed"]},
+        "amount": {"type": "number", "minimum": 0},
+    }
+    for index in range(version):
+        properties[f"field_{index}"] = {"type": "string", "maxLength": 50}
+    return {"type": "object", "properties": properties, "required": ["status"]}
+
+
+def get_data(rng, version):
+    data = {"status": rng.choice(["open", "closed"]), "amount": rng.random() * 100}
+    for index in range(version):
+        data[f"field_{index}"] = f"value {rng.randrange(1000)}"
+    return data
+
+
+def create_tables():
+    from django.db import connection
+    from django.contrib.contenttypes.models import ContentType
+
+    from extensible_models.models import ActiveExtensionSchema, ExtensionSchema
+    from tests.models import ExampleModel, Tenant
+
+    with connection.schema_editor() as editor:
+        for model in (
+            ContentType,
+            Tenant,
+            ExtensionSchema,
+            ActiveExtensionSchema,
+            ExampleModel,
+        ):
+            editor.create_model(model)
+
+
+def populate(tenants, versions, rows):
+    """
+    Creates the tenants, their schema versions (the last one active)
+    and rows, with bulk inserts. Returns the ids of the tenants.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    from extensible_models.models import ActiveExtensionSchema, ExtensionSchema
+    from extensible_models.schemas import schema_hash
+    from tests.models import ExampleModel, Tenant
+
+    rng = random.Random(0)
+    content_type = ContentType.objects.get_for_model(ExampleModel)
+    Tenant.objects.bulk_create(Tenant(name=f"Tenant {i}") for i in range(tenants))
+    tenant_ids = list(Tenant.objects.values_list("pk", flat=True))
+
+    schemas = [get_schema(version) for version in range(1, versions + 1)]
+    hashes = [schema_hash(schema) for schema in schemas]
+    ExtensionSchema.objects.bulk_create(
+        (
+            ExtensionSchema(
+                schema=schema,
+                schema_hash=digest,
+                content_type=content_type,
+                tenant_id=tenant_id,
+                version=version,
+            )
+            for tenant_id in tenant_ids
+            for version, (schema, digest) in enumerate(zip(schemas, hashes), 1)
+        ),
+        batch_size=2000,
+    )
+    latest = ExtensionSchema.objects.filter(version=versions).values_list(
+        "pk", "tenant_id"
+    )
+    ActiveExtensionSchema.objects.bulk_create(
+        (
+            ActiveExtensionSchema(
+                content_type=content_type, schema_id=schema_id, tenant_id=tenant_id
+            )
+            for schema_id, tenant_id in latest
+        ),
+        batch_size=2000,
+    )
+
+    def build(tenant_id, index):
+        version = rng.randint(1, versions)
+        return ExampleModel(
+            name=f"Row {index}",
+            tenant_id=tenant_id,
+            extended_data=get_data(rng, version),
+            extended_schema_version=version,
+        )
+
+    ExampleModel.objects.bulk_create(
+        (build(tenant_id, i) for tenant_id in tenant_ids for i in range(rows)),
+        batch_size=2000,
+    )
+    return tenant_ids
+
+
+def build_handlers(versions, resolve):
+    """
+    Returns a function per code path that serves one request for a
+    tenant. Like a tenant middleware, each sets request.tenant before
+    the view runs.
+    """
+    from django.contrib import admin
+    from django.contrib.admin.utils import flatten_fieldsets
+    from django.test import RequestFactory
+    from rest_framework import serializers, viewsets
+    from rest_framework.test import APIRequestFactory
+
+    from extensible_models.admin import ExtensibleModelAdminMixin
+    from extensible_models.resolvers import SchemaResolutionMiddleware
+    from extensible_models.serializers import ExtensibleModelSerializerMixin
+    from extensible_models.views import ExtensibleModelViewSetMixin
+    from tests.models import ExampleModel, Tenant
+
+    class ExampleSerializer(
+        ExtensibleModelSerializerMixin, serializers.ModelSerializer
+    ):
+        class Meta:
+            model = ExampleModel
+            fields = ["id", "name", "tenant"]
+
+    class ExampleViewSet(ExtensibleModelViewSetMixin, viewsets.ModelViewSet):
+        serializer_class = ExampleSerializer
+
+        def get_queryset(self):
+            return ExampleModel.objects.filter(tenant=self.request.tenant)
+
+    class ExampleAdmin(ExtensibleModelAdminMixin, admin.ModelAdmin):
+        pass
+
+    model_admin = ExampleAdmin(ExampleModel, admin.AdminSite())
+    api = APIRequestFactory()
+    factory = RequestFactory()
+    list_view = ExampleViewSet.as_view({"get": "list"})
+    detail_view = ExampleViewSet.as_view({"get": "retrieve", "patch": "partial_update"})
+    rng = random.Random(2)
+
+    def serve(view, request, tenant, **kwargs):
+        request.tenant = tenant
+        if resolve:
+            return SchemaResolutionMiddleware(lambda r: view(r, **kwargs))(request)
+        return view(request, **kwargs)
+
+    def row_id(tenant):
+        return (
+            ExampleModel.objects.filter(tenant=tenant)
+            .values_list("pk", flat=True)
+            .order_by("?")
+            .first()
+        )
+
+    def list_(tenant, pk):
+        return serve(list_view, api.get("/"), tenant).status_code
+
+    def retrieve(tenant, pk):
+        return serve(detail_view, api.get("/"), tenant, pk=pk).status_code
+
+    def update(tenant, pk):
+        data = {"status": "closed", "amount": rng.random() * 100}
+        request = api.patch("/", data, format="json")
+        return serve(detail_view, request, tenant, pk=pk).status_code
+
+    def admin_(tenant, pk):
+        def view(request):
+            # The hooks ModelAdmin.change_view() calls on a POST
+            obj = ExampleModel.objects.get(pk=pk)
+            fieldsets = model_admin.get_fieldsets(request, obj)
+            form_class = model_admin.get_form(
+                request, obj, change=True, fields=flatten_fieldsets(fieldsets)
+            )
+            data = {"name": obj.name, "tenant": tenant.pk, "status": "open"}
+            data.update(
+                (f"field_{index}", "edited")
+                for index in range(versions)
+                if f"field_{index}" in obj.extended_data
+            )
+            form = form_class(data, instance=obj)
+            if not form.is_valid():
+                return 400
+            model_admin.save_model(request, form.save(commit=False), form, True)
+            return 200
+
+        return serve(view, factory.post("/"), tenant)
+
+    # Fetching the tenant and a row id stands in for the session and URL
+    # lookups of a real request, and is not measured.
+    def prepare(tenant_id):
+        tenant = Tenant.objects.get(pk=tenant_id)
+        return tenant, row_id(tenant)
+
+    handlers = {
+        "list": list_,
+        "retrieve": retrieve,
+        "update": update,
+        "admin": admin_,
+    }
+    return prepare, handlers
+
+
+def cache_timeout(value):
+    # As the setting: a number of seconds, or None for no expiry
+    return None if value.lower() == "none" else int(value)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(prepare, handlers, paths, tenant_ids, requests, concurrency):
+    from django.db import connection, connections
+    from django.test.utils import CaptureQueriesContext
+
+    results = {path: [] for path in paths}
+    errors = {path: [] for path in paths}
+    lock = threading.Lock()
+    rng = random.Random(3)
+    plan = [(rng.choice(paths), rng.choice(tenant_ids)) for _ in range(requests)]
+
+    def serve(item):
+        path, tenant_id = item
+        try:
+            tenant, pk = prepare(tenant_id)
+            with CaptureQueriesContext(connection) as queries:
+                started = perf_counter()
+                status = handlers[path](tenant, pk)
+                elapsed = perf_counter() - started
+        except Exception as e:
+            status = f"{type(e).__name__}: {e}"
+        with lock:
+            if isinstance(status, int) and status < 400:
+                results[path].append((elapsed, len(queries)))
+            else:
+                errors[path].append(status)
+
+    def serve_all(items):
+        try:
+            for item in items:
+                serve(item)
+        finally:
+            connections.close_all()
+
+    started = perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(
+            executor.map(serve_all, [plan[i::concurrency] for i in range(concurrency)])
+        )
+    elapsed = perf_counter() - started
+    return results, errors, elapsed
+
+
+def report(results, errors, elapsed):
+    served = sum(len(samples) for samples in results.values())
+    print(f"\n{served} requests in {elapsed:.2f} s: {served / elapsed:.0f} req/s")
+    print(
+        f"{'path':<10} {'requests':>8} {'errors':>6} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'queries':>8}"
+    )
+    for path, samples in results.items():
+        if not samples:
+            print(f"{path:<10} {0:>8} {len(errors[path]):>6}")
+            continue
+        latencies = [sample[0] * 1000 for sample in samples]
+        queries = sum(sample[1] for sample in samples) / len(samples)
+        print(
+            f"{path:<10} {len(samples):>8} {len(errors[path]):>6} "
+            f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+            f"{queries:>8.1f}"
+        )
+    for path, failures in errors.items():
+        if failures:
+            print(f"{path}: first error: {failures[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--versions", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--paths", default="list,retrieve,update,admin")
+    parser.add_argument(
+        "--resolve",
+        action="store_true",
+        help="Serve requests through SchemaResolutionMiddleware",
+    )
+    parser.add_argument(
+        "--warmup", action="store_true", help="Warm the schema cache up first"
+    )
+    parser.add_argument(
+        "--schema-cache-timeout",
+        type=cache_timeout,
+        default=0,
+        help="Seconds, or 'none' to never expire",
+    )
+    parser.add_argument("--postgres", metavar="DBNAME")
+    args = parser.parse_args()
+
+    configure(args)
+    import extensible_models
+
+    create_tables()
+    started = perf_counter()
+    tenant_ids = populate(args.tenants, args.versions, args.rows)
+    print(
+        f"{args.tenants} tenants x {args.versions} schema versions, "
+        f"{args.tenants * args.rows} rows ({perf_counter() - started:.1f} s)"
+    )
+    if args.warmup:
+        print(f"Warmed up {extensible_models.warmup()} schemas")
+
+    prepare, handlers = build_handlers(args.versions, args.resolve)
+    paths = args.paths.split(",")
+    report(*run(prepare, handlers, paths, tenant_ids, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Shows the query plan and timing of looking up a tenant's latest schema
+version, with and without the (content_type, tenant, -version) index
+on ExtensionSchema, on an in-memory SQLite table with many tenants and
+versions.
+
+    python -m benchmarks.schema_lookup [--tenants 5000] [--versions 20]
+"""
+
+import random
+import argparse
+from time import perf_counter
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "extensible_models",
+            "tests",
+        ],
+        DATABASES={
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        },
+        DEFAULT_AUTO_FIELD="django.db.models.AutoField",
+        EXTENSIBLE_MODELS_TENANT_MODEL="tests.Tenant",
+        EXTENSIBLE_MODELS_TENANT_FIELD="tenant",
+    )
+    django.setup()
+
+from django.db import connection
+from django.contrib.contenttypes.models import ContentType
+
+from extensible_models.models import ExtensionSchema
+from extensible_models.schemas import schema_hash
+from tests.models import ExampleModel, OtherModel, Tenant
+
+
+def create_tables():
+    with connection.schema_editor() as editor:
+        for model in (ContentType, Tenant, ExtensionSchema):
+            editor.create_model(model)
+
+
+def populate(tenants, versions):
+    Tenant.objects.bulk_create(Tenant(name=f"Tenant {i}") for i in range(tenants))
+    tenant_ids = list(Tenant.objects.values_list("pk", flat=True))
+    content_types = ContentType.objects.get_for_models(ExampleModel, OtherModel)
+    rows = []
+    for content_type in content_types.values():
+        for tenant_id in tenant_ids:
+            for version in range(1, versions + 1):
+                schema = {"type": "object", "title": f"v{version}"}
+                rows.append(
+                    ExtensionSchema(
+                        schema=schema,
+                        schema_hash=schema_hash(schema),
+                        content_type=content_type,
+                        tenant_id=tenant_id,
+                        version=version,
+                    )
+                )
+    # Insert in random order, as versions of different tenants interleave
+    random.Random(0).shuffle(rows)
+    ExtensionSchema.objects.bulk_create(rows, batch_size=5000)
+    return tenant_ids, [content_type.pk for content_type in content_types.values()]
+
+
+def latest_schema_query(content_type_id, tenant_id):
+    return (
+        ExtensionSchema.objects.filter(
+            content_type_id=content_type_id, tenant_id=tenant_id
+        )
+        .order_by("-version")
+        .values_list("pk", flat=True)[:1]
+    )
+
+
+def measure(label, tenant_ids, content_type_ids, lookups):
+    """
+    Times the SQL of the lookup alone, so that ORM overhead does not
+    hide the difference.
+    """
+    rng = random.Random(1)
+    query = latest_schema_query(content_type_ids[0], tenant_ids[0])
+    sql, _ = query.query.sql_with_params()
+    print(f"\n{label}")
+    for line in query.explain().splitlines():
+        print(f"  plan: {line}")
+    with connection.cursor() as cursor:
+        started = perf_counter()
+        for _ in range(lookups):
+            params = (rng.choice(content_type_ids), rng.choice(tenant_ids))
+            cursor.execute(sql, params)
+            cursor.fetchone()
+        elapsed = perf_counter() - started
+    print(
+        f"  {lookups} lookups: {elapsed * 1000:.1f} ms "
+        f"({elapsed / lookups * 1e6:.1f} us each)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=5000)
+    parser.add_argument("--versions", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    create_tables()
+    tenant_ids, content_type_ids = populate(args.tenants, args.versions)
+    print(
+        f"{ExtensionSchema.objects.count()} schemas: {args.tenants} tenants, "
+        f"2 content types, {args.versions} versions each"
+    )
+
+    (index,) = ExtensionSchema._meta.indexes
+    with connection.schema_editor() as editor:
+        editor.remove_index(ExtensionSchema, index)
+    measure(
+        "Without the index (unique constraint and single-column indexes only)",
+        tenant_ids,
+        content_type_ids,
+        args.lookups,
+    )
+
+    with connection.schema_editor() as editor:
+        editor.add_index(ExtensionSchema, index)
+    measure(
+        f"With {index.name} (content_type, tenant, version DESC)",
+        tenant_ids,
+        content_type_ids,
+        args.lookups,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,11 @@
 default_app_config = "extensible_models.apps.ExtensibleModelsConfig"
+
+
+def warmup(models=None, tenants=None, limit=None):
+    """
+    Preloads and precompiles the latest extension schemas. See
+    extensible_models.cache.warmup().
+    """
+    from .cache import warmup
+
+    return warmup(models=models, tenants=tenants, limit=limit)
@@ -1,20 +1,107 @@
+import copy
+
 import jsonschema
 
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
 from django import forms
 from django.core.exceptions import ValidationError
-from django.contrib.contenttypes.models import ContentType
+from django.db import router, transaction
+
+
+from .models import EXTENDED_DATA_FIELDS, ExtensionSchema
+from .querysets import extended_key_expression
+from .resolvers import resolve_tenant
+from .utils import (
+    get_model_tenant_field,
+    get_tenant_field,
+    create_form_field,
+    validate_extended_changes,
+    validate_extended_data,
+)
+
+_FILTER_VALUE_CONVERTERS = {
+    "integer": int,
+    "number": float,
+    "boolean": lambda value: value == "true",
+}
+
+
+def extended_column(prop):
+    """
+    Returns a list_display callable for an extended property, sortable
+    in the database.
+    """
+
+    def column(obj):
+        return (obj.extended_data or {}).get(prop.name)
+
+    column.__name__ = prop.name
+    column.short_description = prop.title
+    column.admin_order_field = extended_key_expression(prop)
+    column.boolean = prop.type == "boolean"
+    return column
+
+
+def extended_list_filter(prop):
+    """
+    Returns a list_filter class for a scalar extended property. Choices
+    come from the schema's enum (or are Yes/No for booleans); otherwise
+    the distinct values of the requesting tenant are read with a single
+    query.
+    """
+
+    class ExtendedListFilter(admin.SimpleListFilter):
+        title = prop.title
+        parameter_name = f"extended_{prop.name}"
+
+        def lookups(self, request, model_admin):
+            if prop.enum is not None:
+                return [(str(value), value) for value in prop.enum]
+            if prop.type == "boolean":
+                return [("true", "Yes"), ("false", "No")]
+            # Only offer the requesting tenant's values
+            tenant = model_admin._get_tenant_from_request(request)
+            if tenant is None:
+                return []
+            tenant_field = get_model_tenant_field(model_admin.model)
+            values = (
+                model_admin.get_queryset(request)
+                .filter(**{tenant_field: tenant})
+                .annotate(_extended_value=extended_key_expression(prop))
+                .exclude(_extended_value=None)
+                .values_list("_extended_value", flat=True)
+                .distinct()
+                .order_by("_extended_value")[:100]
+            )
+            return [(str(value), value) for value in values]
 
+        def queryset(self, request, queryset):
+            value = self.value()
+            if value is None:
+                return queryset
+            convert = _FILTER_VALUE_CONVERTERS.get(prop.type, str)
+            try:
+                value = convert(value)
+            except ValueError as e:
+                raise IncorrectLookupParameters(e)
+            return queryset.filter(**{f"extended_data__{prop.name}": value})
 
-from .models import ExtensionSchema
-from .utils import get_tenant_field, create_form_field, validate_extended_data
+    return ExtendedListFilter
 
 
 class ExtensibleModelAdminMixin:
 
+    # Extended keys to show as changelist columns, filters and search
+    # fields. Keys missing from the requesting tenant's schema are skipped.
+    extended_list_display = ()
+    extended_list_filter = ()
+    extended_search_fields = ()
+
     def get_form(self, request, obj=None, **kwargs):
         original_kwargs = kwargs.copy()
-        if "fields" in original_kwargs:
+        original_fields = []
+        if original_kwargs.get("fields") is not None:
             original_fields = [
                 f
                 for f in original_kwargs["fields"]
@@ -22,8 +109,12 @@ class ExtensibleModelAdminMixin:
             ]
             original_kwargs["fields"] = original_fields
 
+        # Let formfield_for_dbfield() see which object the form is for
+        request._extensible_admin_obj = obj
         FormClass = super().get_form(request, obj, **original_kwargs)
-        extension_schema = self._get_extension_schema(obj)
+        extension_schema = self._get_request_extension_schema(
+            request, obj, use_request_tenant=obj is None
+        )
 
         class ExtendedForm(FormClass):
             extended_data = forms.CharField(
@@ -35,15 +126,20 @@ class ExtensibleModelAdminMixin:
             def __init__(self, *args, **kwargs):
                 super().__init__(*args, **kwargs)
                 self.extension_schema = extension_schema
+                # Lets save_model() find the fields changed in any way
+                self.loaded_values = {
+                    field.attname: copy.deepcopy(field.value_from_object(self.instance))
+                    for field in self.instance._meta.concrete_fields
+                    if field.name not in EXTENDED_DATA_FIELDS
+                }
 
                 for field_name in original_fields:
                     if field_name not in self.fields:
                         self.fields[field_name] = self.base_fields[field_name]
 
                 if self.extension_schema:
-                    for field_name, field_schema in self.extension_schema.schema.get(
-                        "properties", {}
-                    ).items():
+                    properties = self.extension_schema.compiled.properties
+                    for field_name, field_schema in properties.items():
                         self.fields[field_name] = create_form_field(
                             field_name, field_schema
                         )
@@ -71,12 +167,16 @@ class ExtensibleModelAdminMixin:
                     return cleaned_data
 
                 if self.extension_schema:
-                    for field_name, field_schema in self.extension_schema.schema.get(
-                        "properties", {}
-                    ).items():
-                        if field_name in self.extension_schema.schema.get(
-                            "required", []
-                        ) and not cleaned_data.get(field_name):
+                    compiled = self.extension_schema.compiled
+                    # Updates only look at the extended fields that were
+                    # edited; untouched values are left as they are.
+                    changed = set(self.changed_data) if is_update else None
+                    for field_name, field_schema in compiled.properties.items():
+                        if changed is not None and field_name not in changed:
+                            continue
+                        if field_name in compiled.required and not cleaned_data.get(
+                            field_name
+                        ):
                             missing_required_fields.append(field_name)
                         if field_name in cleaned_data:
                             value = cleaned_data[field_name]
@@ -87,7 +187,7 @@ class ExtensibleModelAdminMixin:
                                     self.cleaned_extended_data[field_name] = value
                                 elif value:
                                     self.cleaned_extended_data[field_name] = [value]
-                            elif value is not None:
+                            elif value is not None or changed is not None:
                                 self.cleaned_extended_data[field_name] = value
 
                     if missing_required_fields:
@@ -98,23 +198,46 @@ class ExtensibleModelAdminMixin:
                             }
                         )
 
-                    # Validate for both creation and update
-                    validate_extended_data(
-                        self.cleaned_extended_data,
-                        self.extension_schema.schema,
-                        is_creation=not is_update,
-                    )
+                    if is_update:
+                        self._validate_extended_changes(compiled)
+                    else:
+                        validate_extended_data(
+                            self.cleaned_extended_data, compiled, is_creation=True
+                        )
 
                 return cleaned_data
 
+            def _validate_extended_changes(self, compiled):
+                changes = {
+                    key: value
+                    for key, value in self.cleaned_extended_data.items()
+                    if value is not None and value != []
+                }
+                remove = [
+                    key for key in self.cleaned_extended_data if key not in changes
+                ]
+                if not validate_extended_changes(changes, remove, compiled):
+                    # The schema relates several keys: check the whole
+                    # document as it will be stored.
+                    extended_data = {
+                        key: value
+                        for key, value in (self.instance.extended_data or {}).items()
+                        if key in compiled.properties and key not in remove
+                    }
+                    extended_data.update(changes)
+                    validate_extended_data(extended_data, compiled)
+                self.cleaned_extended_data.update(changes)
+
         return ExtendedForm
 
     def get_fieldsets(self, request, obj=None):
         fieldsets = list(super().get_fieldsets(request, obj))
 
-        extension_schema = self._get_extension_schema(obj)
+        extension_schema = self._get_request_extension_schema(
+            request, obj, use_request_tenant=obj is None
+        )
         if extension_schema:
-            extended_fields = list(extension_schema.schema.get("properties", {}).keys())
+            extended_fields = list(extension_schema.compiled.properties)
             fieldsets.append(("Extended Fields", {"fields": extended_fields}))
 
         if obj and obj.extended_data and obj.extended_data != {}:
@@ -124,17 +247,56 @@ class ExtensibleModelAdminMixin:
 
         return fieldsets
 
+    def get_list_display(self, request):
+        list_display = list(super().get_list_display(request))
+        for prop in self._get_extended_properties(request, self.extended_list_display):
+            list_display.append(extended_column(prop))
+        return list_display
+
+    def get_list_filter(self, request):
+        list_filter = list(super().get_list_filter(request))
+        for prop in self._get_extended_properties(request, self.extended_list_filter):
+            if prop.type not in ("array", "object"):
+                list_filter.append(extended_list_filter(prop))
+        return list_filter
+
+    def get_search_fields(self, request):
+        search_fields = list(super().get_search_fields(request))
+        for prop in self._get_extended_properties(request, self.extended_search_fields):
+            search_fields.append(f"extended_data__{prop.name}")
+        return search_fields
+
+    def _get_extended_properties(self, request, keys):
+        """
+        Returns the specs of the given extended keys in the requesting
+        tenant's schema.
+        """
+        if not keys:
+            return []
+        schema = self._get_request_extension_schema(request, use_request_tenant=True)
+        if not schema:
+            return []
+        properties = schema.compiled.properties
+        return [properties[key] for key in keys if key in properties]
+
+    def _get_request_extension_schema(
+        self, request, obj=None, use_request_tenant=False
+    ):
+        """
+        Memoizes _get_extension_schema() on the request, so that the
+        hooks of a single admin view share one schema lookup.
+        """
+        schemas = request.__dict__.setdefault("_extension_schemas", {})
+        key = (self.model, obj.pk if obj else None, use_request_tenant)
+        if key not in schemas:
+            schemas[key] = self._get_extension_schema(
+                obj, request if use_request_tenant else None
+            )
+        return schemas[key]
+
     def _get_extension_schema(self, obj, request=None):
         if obj and hasattr(obj, get_tenant_field()):
-            content_type = ContentType.objects.get_for_model(obj.__class__)
-            return (
-                ExtensionSchema.objects.filter(
-                    content_type=content_type,
-                    **{get_tenant_field(): getattr(obj, get_tenant_field())},
-                )
-                .order_by("-version")
-                .first()
-            )
+            return obj.__class__.get_latest_schema(getattr(obj, get_tenant_field()))
         elif hasattr(self, "model") and request:
             tenant = self._get_tenant_from_request(request)
             if tenant:
@@ -142,17 +304,26 @@ class ExtensibleModelAdminMixin:
         return None
 
     def save_model(self, request, obj, form, change):
-        if change:
-            # This is an update
-            if hasattr(form, "cleaned_extended_data"):
-                # Merge the new data with the existing data
-                for key, value in form.cleaned_extended_data.items():
-                    if value is not None and value != []:
-                        obj.extended_data[key] = value
-                    elif key in obj.extended_data:
-                        # Remove the key if the new value is None or an empty list
-                        del obj.extended_data[key]
-        else:
+        if change and hasattr(form, "cleaned_extended_data"):
+            # This is an update: merge the edited extended keys into the
+            # stored data, and only write the fields that changed. The
+            # form already validated the edited keys.
+            extended_data = dict(obj.extended_data or {})
+            for key, value in form.cleaned_extended_data.items():
+                if value is not None and value != []:
+                    extended_data[key] = value
+                else:
+                    # Remove the key if the new value is None or an empty list
+                    extended_data.pop(key, None)
+            update_fields = self._get_update_fields(obj, form)
+            if extended_data != obj.extended_data:
+                obj.extended_data = extended_data
+                if update_fields is not None:
+                    update_fields.append("extended_data")
+            with transaction.atomic(using=router.db_for_write(obj.__class__)):
+                obj.save(update_fields=update_fields, validate_extended=False)
+            return
+        if not change:
             # This is a new object
             if hasattr(form, "cleaned_extended_data"):
                 obj.extended_data = {
@@ -165,29 +336,51 @@ class ExtensibleModelAdminMixin:
 
         super().save_model(request, obj, form, change)
 
-    def _get_tenant_from_request(self, request):
+    def _get_update_fields(self, obj, form):
+        """
+        Returns the names of the model fields of `obj` that changed since
+        the form loaded it (whether through the form or not) and its
+        auto_now fields, or None if that is unknown and the whole row
+        must be saved.
+        """
+        loaded_values = getattr(form, "loaded_values", None)
+        if loaded_values is None:
+            return None
+        update_fields = []
+        for field in obj._meta.concrete_fields:
+            if field.primary_key or field.name in EXTENDED_DATA_FIELDS:
+                continue
+            if getattr(field, "auto_now", False) or (
+                field.attname not in loaded_values
+                or field.value_from_object(obj) != loaded_values[field.attname]
+            ):
+                update_fields.append(field.name)
+        return update_fields
 
+    def _get_tenant_from_request(self, request):
+        """
+        Returns the tenant of the request or its user, or None if neither
+        has one, in which case views show no extended fields. Override
+        this to find the tenant some other way.
+        """
         tenant_field = get_tenant_field()
 
-        if hasattr(request, tenant_field):
-            return getattr(request, tenant_field)
-        if hasattr(request.user, tenant_field):
-            return getattr(request.user, tenant_field)
-
-        raise NotImplementedError(
-            f"Unable to find '{tenant_field}' in request or user. Implement _get_tenant_from_request in your admin class to handle your specific tenant retrieval logic."
-        )
+        tenant = resolve_tenant(request)
+        if tenant is not None:
+            return tenant
+        return getattr(request.user, tenant_field, None)
 
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
-        extension_schema = self._get_extension_schema(
-            None
-        )  # Pass None as we don't have an object yet
-
-        if extension_schema:
-            field_schema = extension_schema.schema.get("properties", {}).get(
-                db_field.name, {}
+        extension_schema = None
+        if request is not None:
+            obj = getattr(request, "_extensible_admin_obj", None)
+            extension_schema = self._get_request_extension_schema(
+                request, obj, use_request_tenant=obj is None
             )
+
+        if extension_schema and formfield is not None:
+            field_schema = extension_schema.compiled.properties.get(db_field.name, {})
             if field_schema.get("type") == "array" and "items" in field_schema:
                 formfield.required = False  # Make array fields non-required
         return formfield
@@ -195,11 +388,9 @@ class ExtensibleModelAdminMixin:
     def get_fields(self, request, obj=None):
         fields = super().get_fields(request, obj)
         if obj:
-            extension_schema = self._get_extension_schema(obj)
+            extension_schema = self._get_request_extension_schema(request, obj)
             if extension_schema:
-                extended_fields = list(
-                    extension_schema.schema.get("properties", {}).keys()
-                )
+                extended_fields = list(extension_schema.compiled.properties)
                 fields = [
                     f for f in fields if f not in extended_fields
                 ] + extended_fields
@@ -218,6 +409,12 @@ class ExtensionSchemaAdmin(admin.ModelAdmin):
     list_display = ("content_type", get_tenant_field(), "version", "created_at")
     list_filter = ("content_type", get_tenant_field())
     readonly_fields = ("version",)
+    actions = ["activate_schemas"]
+
+    @admin.action(description="Activate selected schemas")
+    def activate_schemas(self, request, queryset):
+        for schema in queryset:
+            schema.activate()
 
     def save_model(self, request, obj, form, change):
         tenant_field = get_tenant_field()
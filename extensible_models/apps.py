@@ -1,12 +1,30 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import DatabaseError
 
 
 class ExtensibleModelsConfig(AppConfig):
 
     name = "extensible_models"
+    default_auto_field = "django.db.models.BigAutoField"
     verbose_name = "Extensible Models"
 
     def ready(self):
         from .models import setup_extension_schema
 
         setup_extension_schema()
+
+        if getattr(settings, "EXTENSIBLE_MODELS_PROFILE_VALIDATION", False):
+            from .profiling import enable_profiling
+
+            enable_profiling()
+
+        if getattr(settings, "EXTENSIBLE_MODELS_WARMUP_ON_READY", False):
+            from .cache import warmup
+
+            try:
+                warmup()
+            except DatabaseError:
+                # The schema table may not exist yet, e.g. while running
+                # the initial migrations.
+                pass
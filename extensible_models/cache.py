@@ -0,0 +1,148 @@
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from .schemas import _LRUCache, get_validator
+from .utils import get_tenant_field
+
+logger = logging.getLogger(__name__)
+
+
+def get_schema_cache_timeout():
+    """
+    Number of seconds a resolved latest schema is reused by this
+    process. 0 (the default) disables the cache, None caches forever.
+    """
+    return getattr(settings, "EXTENSIBLE_MODELS_SCHEMA_CACHE_TIMEOUT", 0)
+
+
+def get_schema_cache_size():
+    return getattr(settings, "EXTENSIBLE_MODELS_SCHEMA_CACHE_SIZE", 10000)
+
+
+_MISSING = object()
+
+_latest_schemas = _LRUCache(get_schema_cache_size())
+
+
+def _get_cached(key):
+    entry = _latest_schemas.get(key)
+    if entry is None:
+        return _MISSING
+    expires_at, schema = entry
+    if expires_at is not None and expires_at < time.monotonic():
+        return _MISSING
+    return schema
+
+
+def _set_cached(key, schema):
+    timeout = get_schema_cache_timeout()
+    if timeout == 0:
+        return
+    expires_at = None if timeout is None else time.monotonic() + timeout
+    _latest_schemas.set(key, (expires_at, schema))
+
+
+def get_cached_latest_schema(content_type_id, tenant_id):
+    """
+    Returns the cached latest schema (possibly None, for tenants
+    without a schema), or _MISSING if nothing usable is cached.
+    """
+    return _get_cached((content_type_id, tenant_id))
+
+
+def set_cached_latest_schema(content_type_id, tenant_id, schema):
+    _set_cached((content_type_id, tenant_id), schema)
+
+
+def invalidate_latest_schema(content_type_id, tenant_id):
+    _latest_schemas.delete((content_type_id, tenant_id))
+
+
+def get_cached_schema_version(content_type_id, tenant_id, version):
+    """
+    Returns the cached schema with the given version (possibly None),
+    or _MISSING if nothing usable is cached.
+    """
+    return _get_cached((content_type_id, tenant_id, version))
+
+
+def set_cached_schema_version(content_type_id, tenant_id, version, schema):
+    _set_cached((content_type_id, tenant_id, version), schema)
+
+
+def invalidate_schema_version(content_type_id, tenant_id, version):
+    _latest_schemas.delete((content_type_id, tenant_id, version))
+
+
+def clear_schema_cache():
+    _latest_schemas.clear()
+
+
+def get_extensible_models():
+    from .models import ExtensibleModelMixin
+
+    return [
+        model for model in apps.get_models() if issubclass(model, ExtensibleModelMixin)
+    ]
+
+
+def warmup(models=None, tenants=None, limit=None):
+    """
+    Loads the active schema of every tenant for the given models (all
+    extensible models by default) and precompiles their validators and
+    serializer field plans, so the first request for a tenant does not
+    pay for it. Runs a single query per model and stops after `limit`
+    schemas, which defaults to the EXTENSIBLE_MODELS_WARMUP_LIMIT
+    setting.
+
+    The loaded schemas are only kept if the schema cache is enabled
+    (see get_schema_cache_timeout()); otherwise only the compiled
+    validators and field plans are.
+
+    Returns the number of schemas warmed up.
+    """
+    from .models import ActiveExtensionSchema
+    from .serializers import get_field_plan
+
+    if models is None:
+        models = get_extensible_models()
+    if limit is None:
+        limit = getattr(settings, "EXTENSIBLE_MODELS_WARMUP_LIMIT", None)
+    if get_schema_cache_timeout() == 0:
+        logger.warning(
+            "EXTENSIBLE_MODELS_SCHEMA_CACHE_TIMEOUT is 0, so warm-up only "
+            "precompiles validators; latest schemas are still queried per "
+            "request."
+        )
+
+    tenant_field = get_tenant_field()
+    tenant_id_field = f"{tenant_field}_id"
+    content_types = ContentType.objects.get_for_models(*models)
+    warmed = 0
+
+    for model in models:
+        if limit is not None and warmed >= limit:
+            break
+        content_type = content_types[model]
+        active = ActiveExtensionSchema.objects.select_related("schema").filter(
+            content_type=content_type
+        )
+        if tenants is not None:
+            active = active.filter(**{f"{tenant_field}__in": tenants})
+        if limit is not None:
+            active = active[: limit - warmed]
+
+        for schema in (activation.schema for activation in active.iterator()):
+            get_validator(schema.compiled)
+            get_validator(schema.compiled, is_creation=True)
+            get_field_plan(schema.compiled)
+            set_cached_latest_schema(
+                content_type.pk, getattr(schema, tenant_id_field), schema
+            )
+            warmed += 1
+
+    return warmed
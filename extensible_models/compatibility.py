@@ -0,0 +1,197 @@
+import re
+
+EQUIVALENT = "equivalent"
+WIDENING = "widening"
+NARROWING = "narrowing"
+BREAKING = "breaking"
+
+COMPATIBILITY_CHOICES = [
+    (EQUIVALENT, "Equivalent"),
+    (WIDENING, "Widening"),
+    (NARROWING, "Narrowing"),
+    (BREAKING, "Breaking"),
+]
+
+_SEVERITY = {EQUIVALENT: 0, WIDENING: 1, NARROWING: 2, BREAKING: 3}
+
+# Keywords that do not affect which documents are valid. Unlike the
+# validator, format is compared: forms and serializers rely on it.
+_ANNOTATION_KEYWORDS = frozenset(
+    {"title", "description", "default", "examples", "$comment"}
+    | {"readOnly", "writeOnly", "deprecated"}
+)
+
+_LOWER_BOUNDS = frozenset(
+    {"minimum", "exclusiveMinimum", "minLength", "minItems", "minProperties"}
+)
+_UPPER_BOUNDS = frozenset(
+    {"maximum", "exclusiveMaximum", "maxLength", "maxItems", "maxProperties"}
+)
+
+
+def _change(kind, prop, keyword, old, new):
+    return {
+        "change": kind,
+        "property": prop,
+        "keyword": keyword,
+        "old": old,
+        "new": new,
+    }
+
+
+def _diff_keyword(keyword, old, new):
+    """
+    Classifies the change of one keyword of a (sub)schema, where None
+    stands for an absent keyword.
+    """
+    if old is None:
+        return NARROWING
+    if new is None:
+        return WIDENING
+    if keyword == "type":
+        old_types = set(old) if isinstance(old, list) else {old}
+        new_types = set(new) if isinstance(new, list) else {new}
+        if all(_covers(new_types, t) for t in old_types):
+            return WIDENING
+        # Integers are the only values a number can keep when narrowed
+        if any(
+            _covers(new_types, t) or (t == "number" and "integer" in new_types)
+            for t in old_types
+        ):
+            return NARROWING
+        return BREAKING
+    if keyword == "enum":
+        if all(value in new for value in old):
+            return WIDENING
+        return NARROWING if any(value in new for value in old) else BREAKING
+    if keyword in ("const", "format"):
+        return BREAKING
+    if keyword in _LOWER_BOUNDS and _is_number(old) and _is_number(new):
+        return WIDENING if new < old else NARROWING
+    if keyword in _UPPER_BOUNDS and _is_number(old) and _is_number(new):
+        return WIDENING if new > old else NARROWING
+    return NARROWING
+
+
+def _covers(types, json_type):
+    return json_type in types or (json_type == "integer" and "number" in types)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _diff_subschema(prop, path, old, new, changes):
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        if old != new:
+            kind = WIDENING if new is True or new == {} else NARROWING
+            changes.append(_change(kind, prop, path, old, new))
+        return
+    for keyword in sorted(old.keys() | new.keys()):
+        if keyword in _ANNOTATION_KEYWORDS:
+            continue
+        old_value, new_value = old.get(keyword), new.get(keyword)
+        if old_value == new_value:
+            continue
+        keyword_path = f"{path}/{keyword}" if path else keyword
+        if keyword == "items" and old_value is not None and new_value is not None:
+            _diff_subschema(prop, keyword_path, old_value, new_value, changes)
+            continue
+        kind = _diff_keyword(keyword, old_value, new_value)
+        changes.append(_change(kind, prop, keyword_path, old_value, new_value))
+
+
+def _diff_removed_property(name, new):
+    """
+    Classifies the removal of a property by what the new schema allows
+    for the key it leaves behind in stored data: its matching
+    patternProperties, or otherwise additionalProperties.
+    """
+    subschemas = [
+        subschema
+        for pattern, subschema in new.get("patternProperties", {}).items()
+        if re.search(pattern, name)
+    ] or [new.get("additionalProperties", True)]
+    if any(subschema is False for subschema in subschemas):
+        return BREAKING
+    if all(subschema is True or subschema == {} for subschema in subschemas):
+        return WIDENING
+    return NARROWING
+
+
+def diff_schemas(old, new):
+    """
+    Returns the structural changes from one extension schema to another,
+    as a list of dicts with the affected property (None when the whole
+    document is affected), the keyword path, the old and new values and
+    how the change affects data valid under the old schema:
+
+    - widening: all such data remains valid (e.g. an added optional
+      property, a removed property whose key is still allowed, a
+      relaxed bound or an enum with more values)
+    - narrowing: some of it may become invalid (e.g. a new required key,
+      a tighter bound or an enum with fewer values)
+    - breaking: none of it can be assumed to remain valid (e.g. a
+      property whose type or format changed, or that was removed while
+      additional properties are not allowed)
+
+    Annotations such as titles and descriptions are ignored.
+    """
+    changes = []
+    old_properties = old.get("properties", {})
+    new_properties = new.get("properties", {})
+    old_required = set(old.get("required", ()))
+    new_required = set(new.get("required", ()))
+
+    for name in old_properties.keys() - new_properties.keys():
+        kind = _diff_removed_property(name, new)
+        changes.append(_change(kind, name, "", old_properties[name], None))
+    for name in new_properties.keys() - old_properties.keys():
+        kind = NARROWING if name in new_required else WIDENING
+        changes.append(_change(kind, name, "", None, new_properties[name]))
+    for name in old_properties.keys() & new_properties.keys():
+        _diff_subschema(name, "", old_properties[name], new_properties[name], changes)
+
+    # Added and removed properties already account for their own
+    # requiredness.
+    for name in new_required - old_required:
+        if name in old_properties or name not in new_properties:
+            changes.append(_change(NARROWING, name, "required", False, True))
+    for name in old_required - new_required:
+        if name in new_properties or name not in old_properties:
+            changes.append(_change(WIDENING, name, "required", True, False))
+
+    top_old = {k: v for k, v in old.items() if k not in ("properties", "required")}
+    top_new = {k: v for k, v in new.items() if k not in ("properties", "required")}
+    _diff_subschema(None, "", top_old, top_new, changes)
+
+    changes.sort(key=lambda change: (change["property"] or "", change["keyword"]))
+    return changes
+
+
+def classify(changes):
+    """
+    Returns the overall compatibility of a list of changes: that of the
+    most severe one, or "equivalent" if there are none.
+    """
+    return max(
+        (change["change"] for change in changes),
+        key=_SEVERITY.__getitem__,
+        default=EQUIVALENT,
+    )
+
+
+def affected_properties(changes):
+    """
+    Returns the names of the properties whose existing values must be
+    re-validated after the given changes, or None if whole documents
+    must be.
+    """
+    affected = set()
+    for change in changes:
+        if change["change"] == WIDENING:
+            continue
+        if change["property"] is None:
+            return None
+        affected.add(change["property"])
+    return affected
@@ -0,0 +1,100 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+class _Echo:
+    """
+    A file-like object that hands back whatever is written to it, so
+    csv.writer can be used to format rows one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_export_columns(model, schema, fields=None):
+    """
+    Returns the (model columns, extended columns) of an export. Without
+    a schema the extended data is exported as a single JSON column.
+    """
+    if fields is None:
+        fields = [
+            field.attname
+            for field in model._meta.concrete_fields
+            if field.name != "extended_data"
+        ]
+    if schema is None:
+        return list(fields), None
+    return list(fields), list(schema.compiled.properties)
+
+
+def _csv_value(value, encoder):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return encoder.encode(value)
+    return value
+
+
+def export_rows(queryset, tenant=None, fields=None, format="csv", chunk_size=2000):
+    """
+    Yields the queryset as CSV lines or JSON lines, with the extended
+    data flattened into one column per schema property (in schema
+    order). The tenant's schema is resolved once and rows are streamed
+    from the database, so memory use does not grow with the queryset.
+    """
+    if format not in EXPORT_CONTENT_TYPES:
+        raise ValueError(f"Unsupported export format: {format}")
+
+    model = queryset.model
+    schema = model.get_latest_schema(tenant) if tenant is not None else None
+    fields, extended_fields = get_export_columns(model, schema, fields)
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    rows = queryset.values_list(*fields, "extended_data").iterator(
+        chunk_size=chunk_size
+    )
+
+    if format == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields + (extended_fields or ["extended_data"]))
+        for *values, extended_data in rows:
+            extended_data = extended_data or {}
+            if extended_fields is None:
+                values.append(encoder.encode(extended_data))
+            else:
+                values.extend(extended_data.get(key) for key in extended_fields)
+            yield writer.writerow([_csv_value(value, encoder) for value in values])
+    else:
+        for *values, extended_data in rows:
+            record = dict(zip(fields, values))
+            extended_data = extended_data or {}
+            if extended_fields is None:
+                record["extended_data"] = extended_data
+            else:
+                for key in extended_fields:
+                    record[key] = extended_data.get(key)
+            yield encoder.encode(record) + "\n"
+
+
+def export_response(
+    queryset, tenant=None, fields=None, format="csv", filename="export"
+):
+    """
+    Returns a StreamingHttpResponse that streams export_rows() to the
+    client as a file download.
+    """
+    if format not in EXPORT_CONTENT_TYPES:
+        raise ValueError(f"Unsupported export format: {format}")
+    response = StreamingHttpResponse(
+        export_rows(queryset, tenant=tenant, fields=fields, format=format),
+        content_type=EXPORT_CONTENT_TYPES[format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return response
@@ -0,0 +1,311 @@
+import json
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import models
+from django.db.models.expressions import Col
+from django.db.models.query_utils import DeferredAttribute
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .schemas import _LRUCache, compile_schema, get_compiled_schema_cache_size
+
+# An encoded document starts with a codec byte and a flags byte. With
+# the KEYED flag, the sha256 digest of the schema whose key table was
+# used follows. The payload is a flat [key, value, key, value, ...]
+# list, in which keys of the schema are replaced by their index in the
+# key table.
+CODEC_JSON = 1
+CODEC_MSGPACK = 2
+FLAG_KEYED = 1
+
+_DIGEST_SIZE = 32
+
+_key_tables = _LRUCache(get_compiled_schema_cache_size())
+
+
+def _get_key_table(digest, compiled=None):
+    """
+    Returns the (names, ids) key table of the schema with the given hex
+    digest: its property names in sorted order, and their indices.
+    """
+    table = _key_tables.get(digest)
+    if table is None:
+        if compiled is not None:
+            names = tuple(sorted(compiled.properties))
+        else:
+            from .models import ExtensionKeyTable
+
+            keys = (
+                ExtensionKeyTable.objects.filter(digest=digest)
+                .values_list("keys", flat=True)
+                .first()
+            )
+            if keys is None:
+                raise ValueError(f"No extension key table with digest {digest}")
+            names = tuple(keys)
+        table = (names, {name: index for index, name in enumerate(names)})
+        _key_tables.set(digest, table)
+    return table
+
+
+def save_key_table(compiled):
+    """
+    Records the key table of a compiled schema, so that rows encoded
+    with it can be decoded by any process, for as long as they exist.
+    """
+    from .models import ExtensionKeyTable
+
+    names, _ = _get_key_table(compiled.hash, compiled)
+    ExtensionKeyTable.objects.get_or_create(
+        digest=compiled.hash, defaults={"keys": list(names)}
+    )
+
+
+def get_compact_codec():
+    """
+    Returns the codec CompactJSONField packs values with, named by the
+    EXTENSIBLE_MODELS_COMPACT_CODEC setting: "json" (the default) or
+    "msgpack". Every process reading the rows must be able to decode
+    it, so it does not depend on which packages happen to be installed.
+    """
+    name = getattr(settings, "EXTENSIBLE_MODELS_COMPACT_CODEC", "json")
+    if name == "json":
+        return CODEC_JSON
+    if name == "msgpack":
+        if msgpack is None:
+            raise ImproperlyConfigured(
+                "EXTENSIBLE_MODELS_COMPACT_CODEC is 'msgpack' but msgpack "
+                "is not installed"
+            )
+        return CODEC_MSGPACK
+    raise ImproperlyConfigured(f"Unknown EXTENSIBLE_MODELS_COMPACT_CODEC: {name!r}")
+
+
+def encode(data, compiled=None, codec=None):
+    """
+    Encodes an extended data dict. With a compiled schema, its keys are
+    stored as indices into the schema's key table. Values are packed
+    with `codec`, by default that of get_compact_codec().
+    """
+    if codec is None:
+        codec = get_compact_codec()
+    items = []
+    if compiled is not None:
+        _, ids = _get_key_table(compiled.hash, compiled)
+        for key, value in data.items():
+            items.extend((ids.get(key, key), value))
+    else:
+        for key, value in data.items():
+            items.extend((key, value))
+
+    if codec == CODEC_MSGPACK:
+        payload = msgpack.packb(items, use_bin_type=True)
+    else:
+        payload = json.dumps(items, separators=(",", ":")).encode()
+
+    if compiled is not None:
+        return bytes((codec, FLAG_KEYED)) + bytes.fromhex(compiled.hash) + payload
+    return bytes((codec, 0)) + payload
+
+
+def decode(raw):
+    """
+    Decodes a document produced by encode(). The key table of a keyed
+    document is looked up by digest, from the database if this process
+    has not seen the schema yet.
+    """
+    raw = bytes(raw)
+    codec, flags = raw[0], raw[1]
+    offset = 2
+    names = None
+    if flags & FLAG_KEYED:
+        offset += _DIGEST_SIZE
+        names, _ = _get_key_table(raw[2:offset].hex())
+    payload = raw[offset:]
+
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ImproperlyConfigured("msgpack is required to decode extended data")
+        items = msgpack.unpackb(payload, raw=False)
+    elif codec == CODEC_JSON:
+        items = json.loads(payload)
+    else:
+        raise ValueError(f"Unknown extended data codec: {codec}")
+
+    items = iter(items)
+    return {
+        names[key] if isinstance(key, int) else key: value
+        for key, value in zip(items, items)
+    }
+
+
+class CompactJSONField(models.BinaryField):
+    """
+    Stores extended data in a compact binary encoding instead of JSON
+    text: keys of the instance's schema are replaced by small integers,
+    and values are packed with the codec named by the
+    EXTENSIBLE_MODELS_COMPACT_CODEC setting. To use it, override the
+    field on an extensible model:
+
+        class Product(ExtensibleModelMixin, models.Model):
+            extended_data = CompactJSONField()
+
+    The database cannot look inside the encoding, so extended keys
+    cannot be filtered, aggregated or searched on in queries.
+    """
+
+    description = "Extended data in a compact binary encoding"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("default", dict)
+        kwargs.setdefault("blank", True)
+        super().__init__(*args, **kwargs)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if isinstance(value, dict):
+            return encode(value, self._get_compiled_schema(model_instance))
+        return value
+
+    def _get_compiled_schema(self, model_instance):
+        try:
+            schema = model_instance.get_extension_schema()
+        except (AttributeError, ObjectDoesNotExist):
+            return None
+        return schema.compiled if schema is not None else None
+
+    def get_prep_value(self, value):
+        # Used for values that bypass pre_save(), e.g. in update()
+        if isinstance(value, dict):
+            value = encode(value)
+        return super().get_prep_value(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
+
+
+# Set while a queryset is building model instances, see LazyJSONField
+_loading_instances = ContextVar("extensible_models_loading_instances", default=False)
+
+
+@contextmanager
+def loading_instances():
+    token = _loading_instances.set(True)
+    try:
+        yield
+    finally:
+        _loading_instances.reset(token)
+
+
+class RawJSON:
+    """
+    The undecoded JSON text of a LazyJSONField value, as loaded from the
+    database.
+    """
+
+    __slots__ = ("raw", "field")
+
+    def __init__(self, raw, field):
+        self.raw = raw
+        self.field = field
+
+    def decode(self):
+        return self.field.decode(self.raw)
+
+    def __repr__(self):
+        return f"<RawJSON: {self.raw[:40]}>"
+
+
+class LazyJSONDescriptor(DeferredAttribute):
+    """
+    Decodes the raw JSON loaded for a model instance on first access.
+    """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, RawJSON):
+            value = instance.__dict__[self.field.attname] = value.decode()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+# orjson reads integers beyond 64 bits as floats, losing precision.
+# Text with that many digits in a row is left to json instead.
+_LONG_DIGITS = re.compile(r"\d{19}")
+
+
+class LazyJSONField(models.JSONField):
+    """
+    A JSONField that leaves the JSON text of loaded model instances
+    undecoded until the attribute is first read, so that code paths that
+    never touch it (e.g. list pages) do not pay for parsing it. Decoding
+    uses orjson when it is installed, no custom decoder is set and the
+    text cannot hold integers that orjson does not read exactly.
+
+    Only instances loaded through an ExtensibleQuerySet are lazy. Values
+    read any other way (values(), values_list(), other managers) are
+    decoded as usual.
+    """
+
+    descriptor_class = LazyJSONDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if (
+            isinstance(value, str)
+            and isinstance(expression, Col)
+            and _loading_instances.get()
+        ):
+            return RawJSON(value, self)
+        return super().from_db_value(value, expression, connection)
+
+    def decode(self, raw):
+        try:
+            if (
+                orjson is not None
+                and self.decoder is None
+                and not _LONG_DIGITS.search(raw)
+            ):
+                return orjson.loads(raw)
+            return json.loads(raw, cls=self.decoder)
+        except ValueError:
+            # As JSONField, return text that is not valid JSON as is
+            return raw
+
+    def get_prep_value(self, value):
+        if isinstance(value, RawJSON):
+            value = value.decode()
+        return super().get_prep_value(value)
+
+
+def is_raw(instance, field_name):
+    """
+    Returns whether a LazyJSONField of a model instance still holds the
+    undecoded value loaded from the database, i.e. it has not been read.
+    """
+    return isinstance(instance.__dict__.get(field_name), RawJSON)
@@ -1,13 +1,11 @@
-from django.contrib.contenttypes.models import ContentType
-
-from .models import ExtensionSchema
-from .utils import get_tenant_field, create_form_field, validate_extended_data
+from .resolvers import resolve_tenant
+from .utils import create_form_field, validate_extended_data
 
 
 class ExtensibleModelFormMixin:
 
     def __init__(self, *args, **kwargs):
-        self.tenant = kwargs.pop("tenant", None)
+        self.tenant = kwargs.pop("tenant", None) or resolve_tenant()
         super().__init__(*args, **kwargs)
         self.extension_schema = self._get_extension_schema()
         self._add_extended_fields()
@@ -16,24 +14,15 @@ class ExtensibleModelFormMixin:
         if hasattr(self, "instance") and self.instance.pk:
             return self.instance.get_extension_schema()
         elif self.tenant:
-            content_type = ContentType.objects.get_for_model(self._meta.model)
-            tenant_field = get_tenant_field()
-            return (
-                ExtensionSchema.objects.filter(
-                    content_type=content_type, **{tenant_field: self.tenant}
-                )
-                .order_by("-version")
-                .first()
-            )
+            return self._meta.model.get_latest_schema(self.tenant)
         return None
 
     def _add_extended_fields(self):
         if not self.extension_schema:
             return
 
-        for field_name, field_schema in self.extension_schema.schema.get(
-            "properties", {}
-        ).items():
+        properties = self.extension_schema.compiled.properties
+        for field_name, field_schema in properties.items():
             field = create_form_field(field_name, field_schema)
             if field:
                 self.fields[field_name] = field
@@ -51,13 +40,13 @@ class ExtensibleModelFormMixin:
         cleaned_data = super().clean()
         if self.extension_schema:
             extended_fields = {}
-            for field_name in self.extension_schema.schema.get("properties", {}):
+            for field_name in self.extension_schema.compiled.properties:
                 if field_name in cleaned_data:
                     extended_fields[field_name] = cleaned_data.pop(field_name)
 
             validate_extended_data(
                 instance=extended_fields,
-                schema=self.extension_schema.schema,
+                schema=self.extension_schema.compiled,
                 is_creation=not self.instance.pk,
             )
 
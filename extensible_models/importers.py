@@ -0,0 +1,266 @@
+import csv
+import json
+import time
+import codecs
+from itertools import islice
+
+from django.db import transaction
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.utils.dateparse import parse_date, parse_time, parse_datetime
+
+from .schemas import compile_schema
+from .utils import get_model_tenant_field
+from .validation import validate_batch
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+class InvalidRecord:
+    """
+    Yielded by parse_rows() in place of a record that could not be
+    parsed, so that the import reports it as a row error.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+def parse_rows(source, format="csv", encoding="utf-8"):
+    """
+    Yields one dict per record of a CSV (with a header row) or JSON
+    lines source, or an InvalidRecord for a line that is not a JSON
+    object. The source may be a file of bytes or text, or any iterable
+    of lines.
+    """
+    if format not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {format}")
+
+    lines = iter(source)
+    first = next(lines, None)
+    if first is None:
+        return
+    if isinstance(first, bytes):
+        lines = codecs.iterdecode(lines, encoding)
+        first = first.decode(encoding)
+    lines = _chain(first, lines)
+
+    if format == "csv":
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield InvalidRecord(f"Invalid JSON: {e.msg}")
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def _parsed(parser):
+    def convert(value):
+        if not isinstance(value, str):
+            return value.isoformat()
+        parsed = parser(value)
+        if parsed is None:
+            raise ValueError(value)
+        return parsed.isoformat()
+
+    return convert
+
+
+def _to_boolean(value):
+    if isinstance(value, str):
+        return value.lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+
+def _to_array(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return [v.strip() for v in value.split(",") if v.strip()]
+    if not isinstance(value, list):
+        return list(value)
+    return value
+
+
+def _identity(value):
+    return value
+
+
+_STRING_CONVERTERS = {
+    "date": _parsed(parse_date),
+    "time": _parsed(parse_time),
+    "date-time": _parsed(parse_datetime),
+}
+
+_TYPE_CONVERTERS = {
+    "number": float,
+    "integer": int,
+    "boolean": _to_boolean,
+    "array": _to_array,
+}
+
+
+def build_converter(schema):
+    """
+    Compiles a schema into a function that coerces the extended fields
+    of a raw record into JSON-ready values. It returns the extended data
+    and a dict of per-field errors. Empty strings (e.g. blank CSV cells)
+    are treated as missing values.
+    """
+    plan = []
+    for name, prop in compile_schema(schema).properties.items():
+        if prop.type == "string":
+            convert = _STRING_CONVERTERS.get(prop.format, _identity)
+        else:
+            convert = _TYPE_CONVERTERS.get(prop.type, _identity)
+        plan.append((name, prop.title, convert))
+
+    def converter(record):
+        extended_data = {}
+        errors = {}
+        for name, title, convert in plan:
+            value = record.get(name)
+            if value is None or value == "":
+                continue
+            try:
+                extended_data[name] = convert(value)
+            except (AttributeError, TypeError, ValueError):
+                errors[name] = f"Invalid value for {title}"
+        return extended_data, errors
+
+    return converter
+
+
+class ImportResult:
+    """
+    Outcome of an import: the number of rows created, the errors of
+    each rejected row (keyed by 1-based row number) and throughput.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.errors = {}
+        self.elapsed = 0.0
+
+    @property
+    def processed(self):
+        return self.created + len(self.errors)
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "failed": len(self.errors),
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def import_rows(model, rows, tenant, batch_size=1000):
+    """
+    Creates model instances for the given records (e.g. from
+    parse_rows()) on behalf of a tenant. Records are coerced with a
+    converter compiled from the tenant's schema, validated in batches
+    and written with bulk_create(), one transaction per batch. Invalid
+    rows are skipped and reported in the returned ImportResult.
+
+    As with bulk_create(), model save() methods and signals are not
+    called. Raises ValueError if `tenant` is None.
+    """
+    if tenant is None:
+        raise ValueError("Records can only be imported for a tenant")
+    result = ImportResult()
+    started = time.perf_counter()
+
+    schema = model.get_latest_schema(tenant)
+    converter = build_converter(schema.compiled) if schema else None
+    version = schema.version if schema else None
+    tenant_field = get_model_tenant_field(model)
+    model_fields = {
+        field.name: field
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in (tenant_field, "extended_data")
+    }
+    model_fields.update({field.attname: field for field in model_fields.values()})
+
+    rows = enumerate(rows, start=1)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        candidates = []
+        for row_number, record in batch:
+            if not isinstance(record, dict):
+                error = (
+                    record.error
+                    if isinstance(record, InvalidRecord)
+                    else "Record must be a JSON object"
+                )
+                result.errors[row_number] = {NON_FIELD_ERRORS: error}
+                continue
+            instance, errors = _build_instance(
+                model, record, tenant, tenant_field, model_fields, converter
+            )
+            if errors:
+                result.errors[row_number] = errors
+            else:
+                candidates.append((row_number, instance))
+
+        invalid = {}
+        if schema is not None and candidates:
+            invalid = validate_batch(
+                [instance.extended_data for _, instance in candidates],
+                schema.compiled,
+            )
+        instances = []
+        for index, (row_number, instance) in enumerate(candidates):
+            if index in invalid:
+                result.errors[row_number] = {"extended_data": " ".join(invalid[index])}
+            else:
+                instance.extended_schema_version = version
+                instances.append(instance)
+        if instances:
+            with transaction.atomic():
+                model.objects.bulk_create(instances, batch_size=batch_size)
+            result.created += len(instances)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _build_instance(model, record, tenant, tenant_field, model_fields, converter):
+    values = {}
+    errors = {}
+    for key, value in record.items():
+        field = model_fields.get(key)
+        if field is None:
+            continue
+        try:
+            values[field.attname] = field.to_python(value)
+        except ValidationError as e:
+            errors[field.name] = " ".join(e.messages)
+
+    extended_data = {}
+    if converter is not None:
+        extended_data, field_errors = converter(record)
+        errors.update(field_errors)
+
+    instance = model(extended_data=extended_data, **{tenant_field: tenant}, **values)
+    try:
+        instance.clean_fields(exclude=[tenant_field, "extended_data", *errors])
+    except ValidationError as e:
+        errors.update({k: " ".join(v) for k, v in e.message_dict.items()})
+
+    return instance, errors
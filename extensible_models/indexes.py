@@ -0,0 +1,96 @@
+import hashlib
+
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError, connections, models
+from django.db.models import Q
+from django.db.models.fields.json import KeyTransform
+
+from .utils import get_model_tenant_field
+
+
+def get_tenant_index(model, tenant, key):
+    """
+    Returns a partial index on the extended key `key` that covers only
+    the tenant's rows. On PostgreSQL, its expression matches the one
+    extended_data lookups compile to, e.g. extended_data__status="open";
+    other backends may not use it for such lookups.
+    """
+    tenant_id = getattr(tenant, "pk", tenant)
+    digest = hashlib.sha256(
+        f"{model._meta.db_table}:{tenant_id}:{key}".encode()
+    ).hexdigest()
+    return models.Index(
+        KeyTransform(key, "extended_data"),
+        condition=Q(**{get_model_tenant_field(model): tenant_id}),
+        # Index names are limited to 30 characters
+        name=f"ext_key_{digest[:20]}",
+    )
+
+
+def get_tenant_indexes(model, tenant, keys=None):
+    """
+    Returns the partial indexes for the given extended keys of a tenant,
+    by default every scalar property of its latest schema.
+    """
+    if keys is None:
+        schema = model.get_latest_schema(tenant)
+        properties = schema.compiled.properties if schema else {}
+        keys = [
+            name
+            for name, prop in properties.items()
+            if prop.type not in ("array", "object")
+        ]
+    return [get_tenant_index(model, tenant, key) for key in keys]
+
+
+def _get_index_names(connection, model):
+    with connection.cursor() as cursor:
+        return set(
+            connection.introspection.get_constraints(cursor, model._meta.db_table)
+        )
+
+
+def create_tenant_indexes(model, tenant, keys=None, using=DEFAULT_DB_ALIAS):
+    """
+    Creates the partial indexes of a tenant's extended keys (see
+    get_tenant_indexes()) that do not exist yet, so that queries through
+    Model.extended.for_tenant(tenant) only read that tenant's entries.
+    Returns the indexes created.
+
+    Indexes are not tracked by migrations: call this again when a new
+    schema version adds keys, and drop_tenant_indexes() before deleting
+    a tenant.
+    """
+    connection = connections[using]
+    features = connection.features
+    if not (features.supports_partial_indexes and features.supports_expression_indexes):
+        raise NotSupportedError(
+            f"{connection.display_name} does not support partial expression indexes"
+        )
+    existing = _get_index_names(connection, model)
+    indexes = [
+        index
+        for index in get_tenant_indexes(model, tenant, keys)
+        if index.name not in existing
+    ]
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.add_index(model, index)
+    return indexes
+
+
+def drop_tenant_indexes(model, tenant, keys=None, using=DEFAULT_DB_ALIAS):
+    """
+    Drops the partial indexes of a tenant's extended keys that exist.
+    Returns the indexes dropped.
+    """
+    connection = connections[using]
+    existing = _get_index_names(connection, model)
+    indexes = [
+        index
+        for index in get_tenant_indexes(model, tenant, keys)
+        if index.name in existing
+    ]
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(model, index)
+    return indexes
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from extensible_models.models import ActiveExtensionSchema, ExtensionSchema
+from extensible_models.utils import get_tenant_field
+
+
+class Command(BaseCommand):
+    help = (
+        "Activates the latest schema version of every tenant and content type "
+        "that has no active schema, e.g. for schemas created before versions "
+        "had to be activated."
+    )
+
+    def handle(self, *args, **options):
+        tenant_field = get_tenant_field()
+        latest_version = (
+            ExtensionSchema.objects.filter(
+                content_type=OuterRef("content_type"),
+                **{tenant_field: OuterRef(tenant_field)},
+            )
+            .order_by("-version")
+            .values("version")[:1]
+        )
+        latest = ExtensionSchema.objects.filter(version=Subquery(latest_version))
+        active = set(
+            ActiveExtensionSchema.objects.values_list(
+                "content_type_id", f"{tenant_field}_id"
+            )
+        )
+
+        activated = 0
+        for schema in latest.iterator():
+            key = (schema.content_type_id, getattr(schema, f"{tenant_field}_id"))
+            if key not in active:
+                schema.activate()
+                activated += 1
+
+        self.stdout.write(f"Activated {activated} schemas")
@@ -0,0 +1,83 @@
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from extensible_models.profiling import profile_validation
+from extensible_models.utils import (
+    get_model_tenant_field,
+    get_tenant_model,
+    validate_extended_data,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Validates a tenant's stored extended data against its latest schema "
+        "and reports the time spent per schema location and keyword."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="Model label, e.g. app_label.ModelName")
+        parser.add_argument("tenant", help="Primary key of the tenant")
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=10000,
+            help="Maximum number of rows to validate (default: 10000)",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Number of entries to report (default: 20)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        tenant_model = get_tenant_model()
+        try:
+            tenant = tenant_model._default_manager.get(pk=options["tenant"])
+        except (tenant_model.DoesNotExist, ValueError):
+            raise CommandError(
+                f"No {tenant_model.__name__} with pk {options['tenant']}"
+            )
+
+        schema = model.get_latest_schema(tenant)
+        if schema is None:
+            raise CommandError(f"{tenant} has no extension schema for {model.__name__}")
+
+        properties = schema.compiled.properties
+        rows = (
+            model._default_manager.filter(**{get_model_tenant_field(model): tenant})
+            .order_by()
+            .values_list("extended_data", flat=True)[: options["limit"]]
+        )
+
+        validated = invalid = 0
+        with profile_validation() as profile:
+            for extended_data in rows.iterator():
+                instance = {
+                    k: v for k, v in (extended_data or {}).items() if k in properties
+                }
+                try:
+                    validate_extended_data(instance, schema.compiled)
+                except ValidationError:
+                    invalid += 1
+                validated += 1
+
+        self.stdout.write(
+            f"Validated {validated} rows ({invalid} invalid) against "
+            f"schema v{schema.version} ({schema.compiled.hash[:12]})"
+        )
+        self.stdout.write(
+            f"{'total (ms)':>12} {'calls':>9} {'mean (us)':>10}  location"
+        )
+        for entry in profile.report(limit=options["top"]):
+            self.stdout.write(
+                f"{entry['total'] * 1000:12.3f} {entry['calls']:9d} "
+                f"{entry['mean'] * 1e6:10.2f}  {entry['pointer']} "
+                f"[{entry['keyword']}]"
+            )
@@ -0,0 +1,125 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from extensible_models.utils import get_tenant_field
+
+# The tenant model and the name of the field pointing to it come from
+# settings, as in setup_extension_schema().
+TENANT_MODEL = settings.EXTENSIBLE_MODELS_TENANT_MODEL
+TENANT_FIELD = get_tenant_field()
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        migrations.swappable_dependency(TENANT_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtensionSchema",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("schema", models.JSONField()),
+                (
+                    "schema_hash",
+                    models.CharField(db_index=True, editable=False, max_length=64),
+                ),
+                ("version", models.PositiveIntegerField(default=1)),
+                (
+                    "compatibility",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("equivalent", "Equivalent"),
+                            ("widening", "Widening"),
+                            ("narrowing", "Narrowing"),
+                            ("breaking", "Breaking"),
+                        ],
+                        editable=False,
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "schema_changes",
+                    models.JSONField(blank=True, default=list, editable=False),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+                (
+                    TENANT_FIELD,
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to=TENANT_MODEL
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ActiveExtensionSchema",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("activated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+                (
+                    TENANT_FIELD,
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to=TENANT_MODEL
+                    ),
+                ),
+                (
+                    "schema",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activations",
+                        to="extensible_models.extensionschema",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="extensionschema",
+            constraint=models.UniqueConstraint(
+                fields=("content_type", "version", TENANT_FIELD),
+                name=f"unique_content_type_{TENANT_FIELD}_version",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="activeextensionschema",
+            constraint=models.UniqueConstraint(
+                fields=("content_type", TENANT_FIELD),
+                name=f"unique_active_content_type_{TENANT_FIELD}",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+from extensible_models.models import get_extension_schema_index_name
+from extensible_models.utils import get_tenant_field
+
+TENANT_FIELD = get_tenant_field()
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the index matching the lookup of a tenant's schema versions:
+    filtered on content type and tenant, ordered by descending version.
+    """
+
+    dependencies = [
+        ("extensible_models", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="extensionschema",
+            index=models.Index(
+                fields=["content_type", TENANT_FIELD, "-version"],
+                name=get_extension_schema_index_name(TENANT_FIELD),
+            ),
+        ),
+    ]
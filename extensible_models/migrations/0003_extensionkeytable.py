@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+from extensible_models.schemas import compile_schema
+
+
+def record_key_tables(apps, schema_editor):
+    """
+    Records the key tables of the existing schemas, which rows written
+    by CompactJSONField reference by digest.
+    """
+    ExtensionSchema = apps.get_model("extensible_models", "ExtensionSchema")
+    ExtensionKeyTable = apps.get_model("extensible_models", "ExtensionKeyTable")
+    db_alias = schema_editor.connection.alias
+    key_tables = {}
+    for digest, schema in ExtensionSchema.objects.using(db_alias).values_list(
+        "schema_hash", "schema"
+    ):
+        if digest and digest not in key_tables:
+            compiled = compile_schema(schema, digest=digest)
+            key_tables[digest] = sorted(compiled.properties)
+    ExtensionKeyTable.objects.using(db_alias).bulk_create(
+        [
+            ExtensionKeyTable(digest=digest, keys=keys)
+            for digest, keys in key_tables.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the table that keeps the key tables of CompactJSONField rows,
+    independently of the schema rows they were written with.
+    """
+
+    dependencies = [
+        ("extensible_models", "0002_extensionschema_version_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtensionKeyTable",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("keys", models.JSONField()),
+            ],
+        ),
+        migrations.RunPython(record_key_tables, migrations.RunPython.noop),
+    ]
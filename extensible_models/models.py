@@ -1,18 +1,53 @@
 import jsonschema
 
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import UniqueConstraint
+from django.db.models import F, UniqueConstraint
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 
-from .utils import get_tenant_field, get_tenant_model, validate_extended_data
+from .cache import (
+    _MISSING,
+    get_cached_latest_schema,
+    get_cached_schema_version,
+    invalidate_latest_schema,
+    invalidate_schema_version,
+    set_cached_latest_schema,
+    set_cached_schema_version,
+)
+from .compatibility import (
+    COMPATIBILITY_CHOICES,
+    affected_properties,
+    classify,
+    diff_schemas,
+)
+from .fields import LazyJSONField, is_raw, save_key_table
+from .querysets import ExtensibleManager, TenantScopedManager
+from .representations import invalidate_representations
+from .resolvers import discard_resolved_schema, get_resolved_schema
+from .schemas import compile_schema, schema_hash
+from .utils import (
+    get_tenant_field,
+    get_tenant_model,
+    validate_extended_changes,
+    validate_extended_data,
+)
+
+
+def get_extension_schema_index_name(tenant_field_name):
+    # Index names are limited to 30 characters
+    return f"ext_schema_{tenant_field_name}"[:26] + "_idx"
 
 
 def setup_extension_schema():
     """
     This function dynamically adds the tenant field and uniqueness
-    constraint to the ExtensionSchema model.
+    constraint to the ExtensionSchema and ActiveExtensionSchema models,
+    and the index used to look up a tenant's schema versions.
 
     This function is called in the AppConfig.ready() method (in
     apps.py) to ensure that app registry is fully populated before the
@@ -32,22 +67,48 @@ def setup_extension_schema():
             name=f"unique_content_type_{tenant_field_name}_version",
         )
     )
+    ExtensionSchema._meta.indexes.append(
+        models.Index(
+            fields=["content_type", tenant_field_name, "-version"],
+            name=get_extension_schema_index_name(tenant_field_name),
+        )
+    )
+
+    ActiveExtensionSchema = import_string(
+        "extensible_models.models.ActiveExtensionSchema"
+    )
+    ActiveExtensionSchema.add_to_class(
+        tenant_field_name, models.ForeignKey(tenant_model, on_delete=models.CASCADE)
+    )
+    ActiveExtensionSchema._meta.constraints.append(
+        UniqueConstraint(
+            fields=["content_type", tenant_field_name],
+            name=f"unique_active_content_type_{tenant_field_name}",
+        )
+    )
 
 
 class ExtensionSchema(models.Model):
 
     schema = models.JSONField()
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    schema_hash = models.CharField(max_length=64, db_index=True, editable=False)
     version = models.PositiveIntegerField(default=1)
+    # How this version changed the previous one, see diff_schemas()
+    compatibility = models.CharField(
+        max_length=10, choices=COMPATIBILITY_CHOICES, blank=True, editable=False
+    )
+    schema_changes = models.JSONField(default=list, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         """
-        The empty constraint below is dynamically updated when
-        setup_extension_schema() is called in AppConfig.ready().
+        The empty constraints and indexes below are dynamically updated
+        when setup_extension_schema() is called in AppConfig.ready().
         """
 
         constraints = []
+        indexes = []
 
     def clean(self):
         """
@@ -59,24 +120,147 @@ class ExtensionSchema(models.Model):
         except jsonschema.exceptions.SchemaError as e:
             raise ValidationError(f"Invalid JSON Schema: {e}")
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, activate=True, **kwargs):
+        """
+        Saves the schema, bumping its version if it changed. A new
+        version is activated for its tenant unless `activate` is False,
+        in which case it is staged until activate() is called.
+        """
         tenant_field_name = get_tenant_field()
         tenant = getattr(self, tenant_field_name)
 
+        new_hash = schema_hash(self.schema)
         if self.pk:
             # Existing schema
-            old_schema = ExtensionSchema.objects.get(pk=self.pk)
-            if self.schema != old_schema.schema:
-                # Schema has changed, increment version
-                self.version = self.get_next_version(tenant)
+            previous = (
+                ExtensionSchema.objects.filter(pk=self.pk)
+                .values_list("schema_hash", "version")
+                .first()
+            )
+            changed = previous is None or new_hash != previous[0]
+            if changed and previous is not None:
+                self._invalidate_version(previous[1])
         else:
-            # New schema
-            self.version = self.get_next_version(tenant)
+            changed = True
+        self.schema_hash = new_hash
 
         # Validate the schema before saving
         self.clean()
 
-        super().save(*args, **kwargs)
+        self.__dict__.pop("compiled", None)
+        with transaction.atomic():
+            if changed:
+                # Schema has changed, increment version and record how it
+                # differs from the version it replaces
+                self.version = self.get_next_version(tenant)
+                active = self._get_active_schema()
+                self._record_changes(active[1] if active else None)
+            super().save(*args, **kwargs)
+            if changed:
+                save_key_table(self.compiled)
+            if changed and activate:
+                self._point_activation()
+        self._invalidate_latest_schema()
+        self._invalidate_version(self.version)
+
+    def activate(self):
+        """
+        Makes this the schema used for its tenant and content type, by
+        atomically pointing their ActiveExtensionSchema row at it. The
+        recorded changes are recomputed against the schema it replaces,
+        which may not be the one that was active when it was staged.
+        """
+        with transaction.atomic():
+            active = self._get_active_schema()
+            if active is not None and active[0] != self.pk:
+                self._update_changes(active[1])
+            self._point_activation()
+
+    def _get_active_schema(self):
+        """
+        Returns the pk and stored content of the tenant's active schema,
+        or None.
+        """
+        tenant_field_name = get_tenant_field()
+        return (
+            ActiveExtensionSchema.objects.filter(
+                content_type=self.content_type,
+                **{tenant_field_name: getattr(self, tenant_field_name)},
+            )
+            .values_list("schema_id", "schema__schema")
+            .first()
+        )
+
+    def _record_changes(self, replaced):
+        # Diffs against the schema this one replaces (None for a first
+        # version), rather than the previous content of this row
+        if replaced is None:
+            self.schema_changes = []
+            self.compatibility = ""
+        else:
+            self.schema_changes = diff_schemas(replaced, self.schema)
+            self.compatibility = classify(self.schema_changes)
+
+    def _update_changes(self, replaced):
+        recorded = (self.schema_changes, self.compatibility)
+        self._record_changes(replaced)
+        if (self.schema_changes, self.compatibility) != recorded:
+            ExtensionSchema.objects.filter(pk=self.pk).update(
+                schema_changes=self.schema_changes, compatibility=self.compatibility
+            )
+
+    def _point_activation(self):
+        tenant_field_name = get_tenant_field()
+        ActiveExtensionSchema.objects.update_or_create(
+            content_type=self.content_type,
+            **{tenant_field_name: getattr(self, tenant_field_name)},
+            defaults={"schema": self},
+        )
+        self._invalidate_latest_schema()
+
+    def _invalidate_latest_schema(self):
+        tenant_id = getattr(self, f"{get_tenant_field()}_id")
+        invalidate_latest_schema(self.content_type_id, tenant_id)
+        discard_resolved_schema(self.content_type_id, tenant_id)
+
+    def _invalidate_version(self, version):
+        tenant_id = getattr(self, f"{get_tenant_field()}_id")
+        invalidate_schema_version(self.content_type_id, tenant_id, version)
+
+    @cached_property
+    def compiled(self):
+        """
+        Returns the shared, immutable compiled form of this schema. The
+        stored content hash is used as the cache key, so identical
+        schemas published by different tenants compile only once per
+        process.
+        """
+        return compile_schema(self.schema, digest=self.schema_hash or None)
+
+    def get_affected_properties(self):
+        """
+        Returns the names of the properties whose existing values may
+        have been invalidated by this version, so that re-validation can
+        skip the others (and everything, for a widening change). Returns
+        None if all data must be re-validated, e.g. for a first version.
+        """
+        if not self.compatibility:
+            return None
+        return affected_properties(self.schema_changes)
+
+    def copy_to_tenant(self, tenant):
+        """
+        Publishes this schema for another tenant, e.g. when onboarding a
+        tenant from a template. The copy shares the content hash, so its
+        compiled schema and validators are already cached.
+        """
+        schema = ExtensionSchema(
+            schema=self.schema,
+            content_type=self.content_type,
+            **{get_tenant_field(): tenant},
+        )
+        schema.save()
+        return schema
 
     def get_next_version(self, tenant):
         """
@@ -100,9 +284,113 @@ class ExtensionSchema(models.Model):
         return f"Schema v{self.version} for {self.content_type} ({tenant_name}: {tenant_value})"
 
 
+class ActiveExtensionSchema(models.Model):
+    """
+    Points at the schema version in use for a tenant and content type,
+    so that resolving it is a single unique-key lookup and publishing a
+    version is a single row update.
+    """
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    schema = models.ForeignKey(
+        ExtensionSchema, on_delete=models.CASCADE, related_name="activations"
+    )
+    activated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """
+        The empty constraint below is dynamically updated when
+        setup_extension_schema() is called in AppConfig.ready().
+        """
+
+        constraints = []
+
+    def __str__(self):
+        return f"Active {self.schema}"
+
+
+class ExtensionKeyTable(models.Model):
+    """
+    The key table of a schema (its property names in sorted order) by
+    content hash, used to decode CompactJSONField rows. Unlike schema
+    rows, these are never changed or deleted, so rows stay readable
+    after the schema that wrote them is edited or deleted.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    keys = models.JSONField()
+
+    def __str__(self):
+        return f"Key table {self.digest}"
+
+
+@receiver(pre_delete, sender=ExtensionSchema)
+def record_schema_activation(sender, instance, using, **kwargs):
+    # Read before the activation is deleted along with the schema
+    instance._was_active = instance.activations.using(using).exists()
+
+
+@receiver(post_delete, sender=ExtensionSchema)
+def replace_deleted_schema(sender, instance, using, **kwargs):
+    """
+    Activates the highest remaining version in place of a deleted active
+    schema, and invalidates the cached lookups of the deleted one. Being
+    a signal receiver, this also runs for queryset and cascade deletes.
+    """
+    if getattr(instance, "_was_active", False):
+        tenant_field_name = get_tenant_field()
+        replacement = (
+            ExtensionSchema.objects.using(using)
+            .filter(
+                content_type_id=instance.content_type_id,
+                **{
+                    f"{tenant_field_name}_id": getattr(
+                        instance, f"{tenant_field_name}_id"
+                    )
+                },
+            )
+            .order_by("-version")
+            .first()
+        )
+        if replacement is not None:
+            # Rows may have been written against the deleted schema
+            replacement._update_changes(instance.schema)
+            replacement.activate()
+    instance._invalidate_latest_schema()
+    instance._invalidate_version(instance.version)
+
+
+class ConcurrentUpdateError(Exception):
+    """
+    Raised when extended data could not be updated because the row was
+    modified concurrently.
+    """
+
+
+def get_update_retries():
+    return getattr(settings, "EXTENSIBLE_MODELS_UPDATE_RETRIES", 3)
+
+
+# Written together whenever the extended data is
+EXTENDED_DATA_FIELDS = ("extended_data", "extended_revision", "extended_schema_version")
+
+
 class ExtensibleModelMixin(models.Model):
 
-    extended_data = models.JSONField(default=dict, blank=True)
+    # Decoded on first access, see LazyJSONField
+    extended_data = LazyJSONField(default=dict, blank=True)
+    # Incremented on every write of extended_data, for optimistic
+    # concurrency control in update_extended().
+    extended_revision = models.PositiveIntegerField(default=0, editable=False)
+    # The schema version extended_data was last written against, so it
+    # can be read as written (see get_stored_schema()).
+    extended_schema_version = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+
+    objects = ExtensibleManager()
+    # Filters on extended keys through this manager require for_tenant()
+    extended = TenantScopedManager()
 
     class Meta:
         abstract = True
@@ -120,46 +408,228 @@ class ExtensibleModelMixin(models.Model):
         )
 
     def get_extension_schema(self):
+        return self.get_latest_schema(self.get_tenant())
+
+    def get_stored_schema(self):
+        """
+        Returns the schema version the extended data was last written
+        against, so that it can be read and rendered as written. Falls
+        back to the latest schema for rows without a recorded version
+        or whose version no longer exists.
+        """
         tenant = self.get_tenant()
-        content_type = ContentType.objects.get_for_model(self.__class__)
-        return (
-            ExtensionSchema.objects.filter(
-                content_type=content_type, **{get_tenant_field(): tenant}
-            )
-            .order_by("-version")
-            .first()
+        schema = None
+        if self.extended_schema_version is not None:
+            schema = self.get_schema_version(tenant, self.extended_schema_version)
+        return schema or self.get_latest_schema(tenant)
+
+    def full_clean(self, exclude=None, *args, **kwargs):
+        # Model forms exclude the fields they do not edit. Forms that edit
+        # extended keys validate those themselves, so the stored data is
+        # not validated again here.
+        self._excludes_extended_data = exclude is not None and (
+            "extended_data" in exclude
         )
+        try:
+            super().full_clean(exclude, *args, **kwargs)
+        finally:
+            del self._excludes_extended_data
 
     def clean(self):
         super().clean()
-        if self.pk:  # Only validate for existing objects
+        # Only validate for existing objects, and only if the extended
+        # data was read since loading (otherwise it cannot have changed)
+        if (
+            self.pk
+            and not is_raw(self, "extended_data")
+            and not getattr(self, "_excludes_extended_data", False)
+        ):
             self.validate_extended_data()
 
-    def validate_extended_data(self):
+    def validate_extended_data(self, extended_data=None):
+        """
+        Validates the extended data against the latest schema, and
+        returns that schema.
+        """
+        if extended_data is None:
+            extended_data = self.extended_data
         schema = self.get_extension_schema()
-        if schema and self.extended_data:
+        if schema and extended_data:
             instance_to_validate = {
                 k: v
-                for k, v in self.extended_data.items()
-                if k in schema.schema.get("properties", {})
+                for k, v in extended_data.items()
+                if k in schema.compiled.properties
             }
             validate_extended_data(
-                instance_to_validate, schema.schema, is_creation=not self.pk
+                instance_to_validate, schema.compiled, is_creation=not self.pk
             )
+        # Lets save() reuse the schema clean() resolved
+        self._validated_schema = schema
+        return schema
 
-    def save(self, *args, **kwargs):
-        if self.extended_data is None:
+    def save(self, *args, validate_extended=True, **kwargs):
+        """
+        Saves the instance. Extended data is validated when it is written,
+        unless `validate_extended` is False because the caller already
+        validated the changes (e.g. the admin's change form).
+        """
+        update_fields = kwargs.get("update_fields")
+        if is_raw(self, "extended_data") and not self._state.adding:
+            # Extended data that was never read is left as it is in the
+            # database, rather than decoded and written back unchanged.
+            if update_fields is None and not kwargs.get("force_insert"):
+                kwargs["update_fields"] = update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in EXTENDED_DATA_FIELDS
+                ]
+        elif self.extended_data is None:
             self.extended_data = {}
-        self.clean()
+        if update_fields is None or "extended_data" in update_fields:
+            # Extended data is only validated when it is written
+            self.__dict__.pop("_validated_schema", None)
+            if validate_extended:
+                self.clean()
+            schema = self.__dict__.pop("_validated_schema", _MISSING)
+            if schema is _MISSING:
+                schema = self.get_extension_schema()
+            self.extended_schema_version = schema.version if schema else None
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, *EXTENDED_DATA_FIELDS}
+            if not self._state.adding:
+                # The UPDATE only applies if the row is still at the loaded
+                # revision (see _do_update()), so a stale instance cannot
+                # overwrite newer extended data.
+                revision = self._expected_revision = self.extended_revision
+                self.extended_revision = F("extended_revision") + 1
+                try:
+                    super().save(*args, **kwargs)
+                except BaseException:
+                    self.extended_revision = revision
+                    raise
+                finally:
+                    del self._expected_revision
+                self.extended_revision = revision + 1
+                invalidate_representations(self, using=self._state.db)
+                return
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            invalidate_representations(self, using=self._state.db)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        revision = getattr(self, "_expected_revision", None)
+        if revision is None:
+            return super()._do_update(
+                base_qs, using, pk_val, values, update_fields, forced_update
+            )
+        updated = super()._do_update(
+            base_qs.filter(extended_revision=revision),
+            using,
+            pk_val,
+            values,
+            update_fields,
+            forced_update,
+        )
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdateError(
+                f"{self.__class__.__name__} {self.pk} was modified concurrently"
+            )
+        return updated
+
+    def update_extended(
+        self, changes=None, remove=(), expected_revision=None, partial=False
+    ):
+        """
+        Sets the `changes` keys and drops the `remove` keys of the stored
+        extended data, leaving every other key as it is in the database.
+        With `partial`, only the changed keys are validated where the
+        schema allows it (see validate_extended_changes()), rather than
+        the whole merged document.
+
+        The write is a single UPDATE conditioned on the row's revision.
+        If another write got in first, the changes are merged into the
+        fresh data and retried (up to EXTENSIBLE_MODELS_UPDATE_RETRIES
+        times). With `expected_revision`, the update instead fails with
+        ConcurrentUpdateError unless the row is still at that revision.
+        """
+        changes = changes or {}
+        schema = self.get_extension_schema()
+        partial = (
+            partial
+            and schema is not None
+            and validate_extended_changes(changes, remove, schema.compiled)
+        )
+        manager = self.__class__._base_manager
+        retries = 0 if expected_revision is not None else get_update_retries()
+        revision = (
+            expected_revision
+            if expected_revision is not None
+            else self.extended_revision
+        )
+
+        for attempt in range(retries + 1):
+            if attempt:
+                self.refresh_from_db(fields=["extended_data", "extended_revision"])
+                revision = self.extended_revision
+            extended_data = {
+                k: v for k, v in (self.extended_data or {}).items() if k not in remove
+            }
+            extended_data.update(changes)
+            if not partial:
+                schema = self.validate_extended_data(extended_data)
+            version = schema.version if schema else None
+            updated = manager.filter(pk=self.pk, extended_revision=revision).update(
+                extended_data=extended_data,
+                extended_revision=revision + 1,
+                extended_schema_version=version,
+            )
+            if updated:
+                self.extended_data = extended_data
+                self.extended_revision = revision + 1
+                self.extended_schema_version = version
+                invalidate_representations(self, using=self._state.db)
+                return
+
+        raise ConcurrentUpdateError(
+            f"{self.__class__.__name__} {self.pk} was modified concurrently"
+        )
 
     @classmethod
     def get_latest_schema(cls, tenant):
+        """
+        Returns the tenant's active schema: its latest version, unless a
+        newer version has been saved with activate=False.
+        """
         content_type = ContentType.objects.get_for_model(cls)
-        return (
-            ExtensionSchema.objects.filter(
-                content_type=content_type, **{get_tenant_field(): tenant}
+        tenant_id = getattr(tenant, "pk", tenant)
+        schema = get_resolved_schema(content_type.pk, tenant_id)
+        if schema is _MISSING:
+            schema = get_cached_latest_schema(content_type.pk, tenant_id)
+        if schema is _MISSING:
+            active = (
+                ActiveExtensionSchema.objects.select_related("schema")
+                .filter(content_type=content_type, **{get_tenant_field(): tenant})
+                .first()
             )
-            .order_by("-version")
-            .first()
-        )
+            schema = active.schema if active is not None else None
+            set_cached_latest_schema(content_type.pk, tenant_id, schema)
+        return schema
+
+    @classmethod
+    def get_schema_version(cls, tenant, version):
+        """
+        Returns the given version of the tenant's schema, or None if it
+        does not exist.
+        """
+        content_type = ContentType.objects.get_for_model(cls)
+        tenant_id = getattr(tenant, "pk", tenant)
+        schema = get_cached_schema_version(content_type.pk, tenant_id, version)
+        if schema is _MISSING:
+            schema = ExtensionSchema.objects.filter(
+                content_type=content_type,
+                version=version,
+                **{get_tenant_field(): tenant},
+            ).first()
+            set_cached_schema_version(content_type.pk, tenant_id, version, schema)
+        return schema
@@ -0,0 +1,138 @@
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+import jsonschema
+
+from . import schemas
+
+
+def _schema_pointers(schema, pointer=""):
+    """
+    Maps the id() of every (sub)schema dict to its JSON pointer, so
+    keyword checks can be attributed to the schema location they run
+    for.
+    """
+    pointers = {}
+    if isinstance(schema, dict):
+        pointers[id(schema)] = pointer or "#"
+        for key, value in schema.items():
+            key = str(key).replace("~", "~0").replace("/", "~1")
+            pointers.update(_schema_pointers(value, f"{pointer or '#'}/{key}"))
+    elif isinstance(schema, list):
+        for index, value in enumerate(schema):
+            pointers.update(_schema_pointers(value, f"{pointer or '#'}/{index}"))
+    return pointers
+
+
+class ValidationProfile:
+    """
+    Collects the number of calls and the cumulative time spent in each
+    keyword check, per schema location (JSON pointer). Times are
+    inclusive: a `properties` check includes the checks of the
+    properties it descends into.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def record(self, schema_hash, pointer, keyword, elapsed):
+        key = (schema_hash, pointer, keyword)
+        with self._lock:
+            calls, total = self.stats.get(key, (0, 0.0))
+            self.stats[key] = (calls + 1, total + elapsed)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def report(self, schema_hash=None, limit=None):
+        """
+        Returns the recorded entries, most expensive first.
+        """
+        entries = [
+            {
+                "schema_hash": key[0],
+                "pointer": key[1],
+                "keyword": key[2],
+                "calls": calls,
+                "total": total,
+                "mean": total / calls,
+            }
+            for key, (calls, total) in self.stats.items()
+            if schema_hash is None or key[0] == schema_hash
+        ]
+        entries.sort(key=lambda entry: entry["total"], reverse=True)
+        return entries[:limit] if limit is not None else entries
+
+    def get_validator(self, compiled, is_creation=False):
+        key = (compiled.hash, is_creation)
+        validator = self._validators.get(key)
+        if validator is None:
+            validation_schema = schemas.get_validation_schema(compiled, is_creation)
+            validator_class = jsonschema.validators.validator_for(validation_schema)
+            validator_class.check_schema(validation_schema)
+            profiling_class = self._profiling_class(
+                validator_class, compiled.hash, _schema_pointers(validation_schema)
+            )
+            validator = self._validators[key] = profiling_class(validation_schema)
+        return validator
+
+    def _profiling_class(self, validator_class, schema_hash, pointers):
+        def timed(keyword, check):
+            def timed_check(validator, value, instance, schema):
+                start = perf_counter()
+                try:
+                    errors = check(validator, value, instance, schema)
+                    if errors is not None:
+                        yield from errors
+                finally:
+                    pointer = pointers.get(id(schema), "(unknown)")
+                    self.record(schema_hash, pointer, keyword, perf_counter() - start)
+
+            return timed_check
+
+        return jsonschema.validators.extend(
+            validator_class,
+            {
+                keyword: timed(keyword, check)
+                for keyword, check in validator_class.VALIDATORS.items()
+            },
+        )
+
+
+def get_active_profile():
+    return schemas._active_profile
+
+
+def enable_profiling(profile=None):
+    """
+    Routes all extended data validation through profiling validators
+    that record into `profile` (a new ValidationProfile by default),
+    and returns it.
+    """
+    schemas._active_profile = profile or ValidationProfile()
+    return schemas._active_profile
+
+
+def disable_profiling():
+    schemas._active_profile = None
+
+
+@contextmanager
+def profile_validation(profile=None):
+    """
+    Profiles the extended data validation run inside the block:
+
+        with profile_validation() as profile:
+            ...
+        profile.report(limit=10)
+    """
+    previous = schemas._active_profile
+    profile = enable_profiling(profile)
+    try:
+        yield profile
+    finally:
+        schemas._active_profile = previous
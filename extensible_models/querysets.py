@@ -0,0 +1,226 @@
+from django.db import models
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Cast
+from django.db.models.query import ModelIterable
+from django.core.exceptions import FieldDoesNotExist, FieldError
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+
+from .fields import RawJSON, loading_instances
+
+_STRING_FORMAT_FIELDS = {
+    "date": models.DateField,
+    "date-time": models.DateTimeField,
+    "time": models.TimeField,
+}
+
+_TYPE_FIELDS = {
+    "integer": models.IntegerField,
+    "number": models.FloatField,
+    "boolean": models.BooleanField,
+}
+
+
+def extended_key_expression(prop):
+    """
+    Returns a database expression that extracts a schema property from
+    extended_data, cast to the SQL type matching its JSON schema type.
+    """
+    if prop.type in ("array", "object"):
+        return KeyTransform(prop.name, "extended_data")
+    text = KeyTextTransform(prop.name, "extended_data")
+    if prop.type == "string":
+        output_field = _STRING_FORMAT_FIELDS.get(prop.format)
+    else:
+        output_field = _TYPE_FIELDS.get(prop.type)
+    if output_field is None:
+        return text
+    return Cast(text, output_field())
+
+
+class LazyModelIterable(ModelIterable):
+    """
+    Builds model instances whose LazyJSONFields are left undecoded.
+    Annotations are never lazy, as only fields have a decoding
+    descriptor.
+    """
+
+    def __iter__(self):
+        annotations = list(self.queryset.query.annotation_select)
+        iterator = super().__iter__()
+        while True:
+            # Only rows converted while the flag is set are kept raw
+            with loading_instances():
+                try:
+                    obj = next(iterator)
+                except StopIteration:
+                    return
+            for name in annotations:
+                value = obj.__dict__.get(name)
+                if isinstance(value, RawJSON):
+                    obj.__dict__[name] = value.decode()
+            yield obj
+
+
+class ExtensibleQuerySet(models.QuerySet):
+    """
+    A queryset that can group and aggregate on extended fields in the
+    database. Extended keys are referred to by their bare names and are
+    typed using the schema of the tenant selected with for_tenant():
+
+        Model.objects.for_tenant(tenant).aggregate_extended(total=Sum("amount"))
+        Model.objects.for_tenant(tenant).values_extended("status").annotate(
+            count=Count("pk")
+        )
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._extension_tenant = None
+        self._iterable_class = LazyModelIterable
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._extension_tenant = self._extension_tenant
+        return clone
+
+    def for_tenant(self, tenant):
+        from .utils import get_model_tenant_field
+
+        clone = self.filter(**{get_model_tenant_field(self.model): tenant})
+        clone._extension_tenant = tenant
+        return clone
+
+    def get_extension_schema(self):
+        if self._extension_tenant is None:
+            raise FieldError(
+                "Call for_tenant() before querying extended fields, so that "
+                "their types can be read from the tenant's schema."
+            )
+        return self.model.get_latest_schema(self._extension_tenant)
+
+    def extended_key(self, name):
+        """
+        Returns the typed expression for the extended key `name`.
+        """
+        schema = self.get_extension_schema()
+        prop = schema.compiled.properties.get(name) if schema else None
+        if prop is None:
+            raise FieldError(f"'{name}' is not an extended field of this tenant")
+        return extended_key_expression(prop)
+
+    def _resolve_extended_refs(self, expression):
+        if isinstance(expression, F) and self._is_extended_key(expression.name):
+            return self.extended_key(expression.name)
+        if not hasattr(expression, "get_source_expressions"):
+            return expression
+        expression = expression.copy()
+        expression.set_source_expressions(
+            [
+                self._resolve_extended_refs(source)
+                for source in expression.get_source_expressions()
+            ]
+        )
+        return expression
+
+    def _is_extended_key(self, name):
+        if name == "pk" or LOOKUP_SEP in name or name in self.query.annotations:
+            return False
+        try:
+            self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return True
+        return False
+
+    def values_extended(self, *fields, **expressions):
+        """
+        Like values(), but bare names that are not model fields are read
+        from extended_data.
+        """
+        clone = self
+        extended = {
+            name: self.extended_key(name)
+            for name in fields
+            if self._is_extended_key(name)
+        }
+        if extended:
+            clone = clone.annotate(**extended)
+        return clone.values(
+            *fields,
+            **{
+                name: self._resolve_extended_refs(value)
+                for name, value in expressions.items()
+            },
+        )
+
+    def annotate_extended(self, *args, **kwargs):
+        """
+        Like annotate(), with references to extended keys (e.g.
+        Sum("amount")) resolved to typed expressions.
+        """
+        return self.annotate(
+            *[self._resolve_extended_refs(arg) for arg in args],
+            **{
+                name: self._resolve_extended_refs(value)
+                for name, value in kwargs.items()
+            },
+        )
+
+    def aggregate_extended(self, *args, **kwargs):
+        """
+        Like aggregate(), with references to extended keys (e.g.
+        Sum("amount")) resolved to typed expressions.
+        """
+        return self.aggregate(
+            *[self._resolve_extended_refs(arg) for arg in args],
+            **{
+                name: self._resolve_extended_refs(value)
+                for name, value in kwargs.items()
+            },
+        )
+
+
+class ExtensibleManager(models.Manager.from_queryset(ExtensibleQuerySet)):
+    pass
+
+
+def _refers_to_extended_data(lookup):
+    return lookup == "extended_data" or lookup.startswith(f"extended_data{LOOKUP_SEP}")
+
+
+def _has_extended_predicate(args, kwargs):
+    for lookup in kwargs:
+        if _refers_to_extended_data(lookup):
+            return True
+    for arg in args:
+        if isinstance(arg, Q):
+            children = arg.children
+            nested = [child for child in children if isinstance(child, Q)]
+            lookups = dict(child for child in children if isinstance(child, tuple))
+            if _has_extended_predicate(nested, lookups):
+                return True
+    return False
+
+
+class TenantScopedQuerySet(ExtensibleQuerySet):
+    """
+    An ExtensibleQuerySet that only filters on extended_data within a
+    tenant: extended keys only mean something in one tenant's schema,
+    so for_tenant() must come first, and its tenant predicate lets the
+    database stay within that tenant's rows (e.g. a partial index from
+    create_tenant_indexes()).
+
+        Model.extended.for_tenant(tenant).filter(extended_data__status="open")
+    """
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        if self._extension_tenant is None and _has_extended_predicate(args, kwargs):
+            raise FieldError(
+                "Call for_tenant() before filtering on extended fields, so "
+                "that the query is restricted to one tenant's rows."
+            )
+        return super()._filter_or_exclude(negate, args, kwargs)
+
+
+class TenantScopedManager(models.Manager.from_queryset(TenantScopedQuerySet)):
+    pass
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Names of the serializers whose representations are cached, so that
+# all of them can be invalidated when an instance changes.
+_cached_serializers = set()
+
+
+def get_representation_cache():
+    """
+    Returns the Django cache that rendered representations are stored
+    in, named by the EXTENSIBLE_MODELS_REPRESENTATION_CACHE setting, or
+    None if representation caching is disabled (the default).
+    """
+    alias = getattr(settings, "EXTENSIBLE_MODELS_REPRESENTATION_CACHE", None)
+    return caches[alias] if alias is not None else None
+
+
+def get_representation_cache_timeout():
+    return getattr(settings, "EXTENSIBLE_MODELS_REPRESENTATION_CACHE_TIMEOUT", 300)
+
+
+def register_serializer(name):
+    _cached_serializers.add(name)
+
+
+def representation_key(name, instance):
+    """
+    Returns the cache key of an instance's representation by the named
+    serializer. It includes the row's extended revision and schema
+    version, so entries for older states are never read again.
+    Serializers only cache rows written against the schema version they
+    render with (see ExtensibleModelSerializerMixin).
+    """
+    return ":".join(
+        str(part)
+        for part in (
+            "extensible_models.repr",
+            name,
+            instance._meta.label_lower,
+            instance.pk,
+            instance.extended_revision,
+            instance.extended_schema_version,
+        )
+    )
+
+
+def invalidate_representations(instance, using=None):
+    """
+    Deletes the cached representations of an instance's state as it was
+    just saved, once the transaction commits, so that a representation
+    rendered from the previous state before the commit is not kept.
+    """
+    cache = get_representation_cache()
+    if cache is None or not _cached_serializers or instance.pk is None:
+        return
+    keys = [representation_key(name, instance) for name in _cached_serializers]
+    transaction.on_commit(lambda: cache.delete_many(keys), using=using)
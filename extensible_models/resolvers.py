@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils.module_loading import import_string
+
+from .cache import _MISSING, get_extensible_models
+from .utils import get_tenant_field
+
+# The tenant and schemas resolved for the current request, if it went
+# through SchemaResolutionMiddleware.
+_resolution = ContextVar("extensible_models_resolution", default=None)
+
+
+class Resolution:
+    """
+    A tenant and its active schema per extensible model (keyed by
+    content type id, None for models without a schema).
+    """
+
+    def __init__(self, tenant, schemas):
+        self.tenant = tenant
+        self.tenant_id = getattr(tenant, "pk", tenant)
+        self.schemas = schemas
+
+    def get_schema(self, content_type_id, tenant_id):
+        """
+        Returns the resolved schema, or _MISSING if the tenant or model
+        was not resolved.
+        """
+        if tenant_id is None or tenant_id != self.tenant_id:
+            return _MISSING
+        return self.schemas.get(content_type_id, _MISSING)
+
+    def discard(self, content_type_id, tenant_id):
+        if tenant_id == self.tenant_id:
+            self.schemas.pop(content_type_id, None)
+
+
+class SchemaResolver:
+    """
+    Finds the tenant of a request and loads its active schemas. Set the
+    EXTENSIBLE_MODELS_SCHEMA_RESOLVER setting to the dotted path of a
+    subclass to change how either is done.
+    """
+
+    def get_tenant(self, request):
+        return getattr(request, get_tenant_field(), None)
+
+    def get_schemas(self, tenant, models=None):
+        """
+        Returns the tenant's active schema for each of the given models
+        (all extensible models by default), keyed by content type id.
+        Runs a single query.
+        """
+        from .models import ActiveExtensionSchema
+
+        if models is None:
+            models = get_extensible_models()
+        content_type_ids = [
+            content_type.pk
+            for content_type in ContentType.objects.get_for_models(*models).values()
+        ]
+        schemas = dict.fromkeys(content_type_ids)
+        active = ActiveExtensionSchema.objects.select_related("schema").filter(
+            content_type__in=content_type_ids, **{get_tenant_field(): tenant}
+        )
+        for activation in active:
+            schemas[activation.content_type_id] = activation.schema
+        return schemas
+
+    def resolve(self, request):
+        tenant = self.get_tenant(request)
+        if tenant is None:
+            return None
+        return Resolution(tenant, self.get_schemas(tenant))
+
+
+def get_resolver():
+    path = getattr(
+        settings,
+        "EXTENSIBLE_MODELS_SCHEMA_RESOLVER",
+        "extensible_models.resolvers.SchemaResolver",
+    )
+    return import_string(path)()
+
+
+def get_resolution():
+    return _resolution.get()
+
+
+def get_current_tenant():
+    """
+    Returns the tenant resolved for the current request, or None.
+    """
+    resolution = _resolution.get()
+    return resolution.tenant if resolution is not None else None
+
+
+def get_resolved_schema(content_type_id, tenant_id):
+    resolution = _resolution.get()
+    if resolution is None:
+        return _MISSING
+    return resolution.get_schema(content_type_id, tenant_id)
+
+
+def discard_resolved_schema(content_type_id, tenant_id):
+    resolution = _resolution.get()
+    if resolution is not None:
+        resolution.discard(content_type_id, tenant_id)
+
+
+def resolve_tenant(request=None):
+    """
+    Returns the tenant resolved for the current request if there is
+    one, and otherwise asks the configured resolver for the tenant of
+    `request`.
+    """
+    resolution = _resolution.get()
+    if resolution is not None:
+        return resolution.tenant
+    if request is None:
+        return None
+    return get_resolver().get_tenant(request)
+
+
+@contextmanager
+def resolved(request):
+    """
+    Resolves the tenant and schemas of a request and makes them current
+    inside the block.
+    """
+    token = _resolution.set(get_resolver().resolve(request))
+    try:
+        yield _resolution.get()
+    finally:
+        _resolution.reset(token)
+
+
+class SchemaResolutionMiddleware:
+    """
+    Resolves the requesting tenant and its schemas once per request, so
+    that forms, serializers and admin classes read them without further
+    queries. Add it after the middleware that sets the tenant on the
+    request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with resolved(request):
+            return self.get_response(request)
@@ -0,0 +1,265 @@
+import sys
+import json
+import hashlib
+import threading
+import jsonschema
+from collections import OrderedDict
+from types import MappingProxyType
+
+from django.conf import settings
+
+
+def schema_hash(schema):
+    """
+    Returns a stable content hash for a JSON schema document. Two
+    schemas that only differ in key order hash identically.
+    """
+    payload = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def freeze(value):
+    """
+    Converts a JSON document into an immutable equivalent: dicts
+    become read-only mappings, lists become tuples and all dictionary
+    keys and string values are interned so identical strings are
+    shared across schemas.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType(
+            {sys.intern(str(k)): freeze(v) for k, v in value.items()}
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def thaw(value):
+    """
+    Converts a frozen document back into plain dicts and lists.
+    """
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+class _Frozen:
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+
+class PropertySpec(_Frozen):
+    """
+    A compact, immutable description of a single schema property.
+    """
+
+    __slots__ = (
+        "name",
+        "type",
+        "format",
+        "enum",
+        "items_type",
+        "items_enum",
+        "title",
+        "description",
+        "minimum",
+        "maximum",
+        "min_length",
+        "max_length",
+        "pattern",
+        "required",
+        "schema",
+    )
+
+    def __init__(self, name, schema, required):
+        items = schema.get("items") or MappingProxyType({})
+        values = {
+            "name": name,
+            "type": schema.get("type"),
+            "format": schema.get("format"),
+            "enum": schema.get("enum"),
+            "items_type": items.get("type"),
+            "items_enum": items.get("enum"),
+            "title": schema.get("title", name),
+            "description": schema.get("description", ""),
+            "minimum": schema.get("minimum"),
+            "maximum": schema.get("maximum"),
+            "min_length": schema.get("minLength"),
+            "max_length": schema.get("maxLength"),
+            "pattern": schema.get("pattern"),
+            "required": required,
+            "schema": schema,
+        }
+        for attr, value in values.items():
+            object.__setattr__(self, attr, value)
+
+    # PropertySpec doubles as a read-only view of the raw property
+    # schema, so it can be passed anywhere a property dict is expected.
+
+    def get(self, key, default=None):
+        return self.schema.get(key, default)
+
+    def __getitem__(self, key):
+        return self.schema[key]
+
+    def __contains__(self, key):
+        return key in self.schema
+
+    def __repr__(self):
+        return f"<PropertySpec {self.name}: {self.type}>"
+
+
+class CompiledSchema(_Frozen):
+    """
+    An immutable, interned view of an extension schema. Instances are
+    shared between every ExtensionSchema row (of any tenant) with the
+    same content, so they can be handed to forms, serializers and the
+    admin alike.
+    """
+
+    __slots__ = ("hash", "schema", "properties", "required", "__weakref__")
+
+    def __init__(self, digest, schema):
+        frozen = freeze(schema)
+        required = frozenset(frozen.get("required", ()))
+        properties = {
+            name: PropertySpec(name, prop_schema, name in required)
+            for name, prop_schema in frozen.get(
+                "properties", MappingProxyType({})
+            ).items()
+        }
+        object.__setattr__(self, "hash", sys.intern(digest))
+        object.__setattr__(self, "schema", frozen)
+        object.__setattr__(self, "required", required)
+        object.__setattr__(self, "properties", MappingProxyType(properties))
+
+    def __iter__(self):
+        return iter(self.properties.values())
+
+    def __len__(self):
+        return len(self.properties)
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledSchema) and other.hash == self.hash
+
+    def __hash__(self):
+        return hash(self.hash)
+
+    def __repr__(self):
+        return f"<CompiledSchema {self.hash[:12]} ({len(self)} properties)>"
+
+    def to_dict(self):
+        return thaw(self.schema)
+
+
+class _LRUCache:
+    """
+    A small thread-safe LRU cache used for the process-wide caches of
+    compiled schema artefacts.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_compiled_schema_cache_size():
+    return getattr(settings, "EXTENSIBLE_MODELS_COMPILED_SCHEMA_CACHE_SIZE", 1024)
+
+
+_compiled_schemas = _LRUCache(get_compiled_schema_cache_size())
+
+
+def compile_schema(schema, digest=None):
+    """
+    Returns the shared CompiledSchema for the given schema document,
+    compiling it only if no identical schema has been seen before.
+    """
+    if isinstance(schema, CompiledSchema):
+        return schema
+    if digest is None:
+        digest = schema_hash(schema)
+    compiled = _compiled_schemas.get(digest)
+    if compiled is None:
+        compiled = _compiled_schemas.set(digest, CompiledSchema(digest, schema))
+    return compiled
+
+
+_validators = _LRUCache(get_compiled_schema_cache_size())
+
+# Set by extensible_models.profiling while validation is being profiled.
+_active_profile = None
+
+
+def get_validation_schema(compiled, is_creation=False):
+    """
+    Returns a fresh schema dict to validate against. Creation schemas
+    drop the top-level required list and the minItems of array
+    properties.
+    """
+    validation_schema = compiled.to_dict()
+    if is_creation:
+        validation_schema.pop("required", None)
+        for prop in validation_schema.get("properties", {}).values():
+            if prop.get("type") == "array":
+                prop.pop("minItems", None)
+    return validation_schema
+
+
+def get_validator(schema, is_creation=False):
+    """
+    Returns a ready-to-use jsonschema validator for the given schema,
+    cached by content hash.
+    """
+    compiled = compile_schema(schema)
+    if _active_profile is not None:
+        return _active_profile.get_validator(compiled, is_creation)
+    key = (compiled.hash, is_creation)
+    validator = _validators.get(key)
+    if validator is None:
+        validation_schema = get_validation_schema(compiled, is_creation)
+        validator_class = jsonschema.validators.validator_for(validation_schema)
+        validator_class.check_schema(validation_schema)
+        validator = _validators.set(key, validator_class(validation_schema))
+    return validator
@@ -1,104 +1,260 @@
 import json
 from datetime import date, datetime
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.utils import model_meta
 
 from django.core.exceptions import ValidationError
 from django.utils.dateparse import parse_date, parse_time, parse_datetime
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
 
+from .models import ConcurrentUpdateError
+from .representations import (
+    get_representation_cache,
+    get_representation_cache_timeout,
+    register_serializer,
+    representation_key,
+)
+from .resolvers import resolve_tenant
+from .schemas import _LRUCache, get_compiled_schema_cache_size
 from .utils import get_tenant_field, validate_extended_data
 
+_STRING_FORMAT_FIELDS = {
+    "date": serializers.DateField,
+    "time": serializers.TimeField,
+    "date-time": serializers.DateTimeField,
+    "email": serializers.EmailField,
+    "uri": serializers.URLField,
+}
+
+_TYPE_FIELDS = {
+    "number": serializers.FloatField,
+    "integer": serializers.IntegerField,
+    "boolean": serializers.BooleanField,
+}
+
+
+def _plan_field(field_name, field_schema, required):
+    field_type = field_schema.get("type")
+    field_args = {
+        "required": required,
+        "allow_null": not field_schema.get("required", False),
+        "label": field_schema.get("title", field_name),
+        "help_text": field_schema.get("description", ""),
+    }
+
+    if field_type == "string":
+        field_class = _STRING_FORMAT_FIELDS.get(field_schema.get("format"))
+        if field_class is not None:
+            return field_class, field_args
+        if "enum" in field_schema:
+            choices = [(choice, choice) for choice in field_schema["enum"]]
+            return serializers.ChoiceField, {"choices": choices, **field_args}
+        return serializers.CharField, field_args
+    if field_type in _TYPE_FIELDS:
+        return _TYPE_FIELDS[field_type], field_args
+    if field_type == "array":
+        if "items" in field_schema and "enum" in field_schema["items"]:
+            choices = [(choice, choice) for choice in field_schema["items"]["enum"]]
+            return serializers.MultipleChoiceField, {"choices": choices, **field_args}
+        return serializers.ListField, field_args
+    return serializers.JSONField, field_args
+
+
+_field_plans = _LRUCache(get_compiled_schema_cache_size())
+
+
+def get_field_plan(compiled):
+    """
+    Returns the serializer field class and arguments for each property
+    of a compiled schema. Plans are cached by schema content, so they
+    are worked out once per schema version rather than per serializer.
+    """
+    plan = _field_plans.get(compiled.hash)
+    if plan is None:
+        plan = {
+            name: _plan_field(name, prop, name in compiled.required)
+            for name, prop in compiled.properties.items()
+        }
+        _field_plans.set(compiled.hash, plan)
+    return plan
+
 
 class ExtensibleModelSerializerMixin(serializers.ModelSerializer):
+    """
+    Adds a field for each property of the tenant's extension schema.
+    Fields are only built when the serializer's fields are first used,
+    from a plan cached per schema version.
+
+    Clients can request a subset of the fields on reads with a query
+    parameter (?fields=id,name,status), and code can pass fields=[...]
+    to the serializer. Only the requested fields are built and output.
+    """
+
+    # The query parameter for sparse fieldsets, or None to disable them
+    sparse_fields_param = "fields"
+
+    # Cache rendered representations in the cache named by the
+    # EXTENSIBLE_MODELS_REPRESENTATION_CACHE setting. Only enable this
+    # for serializers whose output depends on nothing but the instance.
+    cache_representation = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.cache_representation:
+            register_serializer(cls._get_representation_name())
+
+    @classmethod
+    def _get_representation_name(cls):
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        if type(serializer) is serializers.ListSerializer:
+            # Lets the child fetch cached representations in bulk
+            serializer.__class__ = ExtensibleListSerializer
+        return serializer
 
     def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
         self.tenant = self._get_tenant(kwargs.get("context", {}))
         self.extension_schema = self._get_extension_schema()
         super().__init__(*args, **kwargs)
-        self._add_extended_fields()
+        self._requested_fields = set(fields) if fields is not None else None
 
     def _get_tenant(self, context):
-        request = context.get("request")
-        tenant_field = get_tenant_field()
-        if request and hasattr(request, tenant_field):
-            return getattr(request, tenant_field)
-        if self.instance:
-            return getattr(self.instance, tenant_field)
-        return None
+        tenant = resolve_tenant(context.get("request"))
+        if tenant is None and self.instance:
+            return getattr(self.instance, get_tenant_field())
+        return tenant
 
     def _get_extension_schema(self):
         if not self.tenant:
             return None
         return self.Meta.model.get_latest_schema(self.tenant)
 
-    def _add_extended_fields(self):
-        if not self.extension_schema:
-            return
-        for field_name, field_schema in self.extension_schema.schema.get(
-            "properties", {}
-        ).items():
-            self.fields[field_name] = self._create_dynamic_field(
-                field_name, field_schema
-            )
+    def get_requested_fields(self):
+        """
+        Returns the names of the fields requested by the fields argument
+        or, for reads by the top-level serializer, the sparse fieldset
+        query parameter. Returns None if all fields are wanted.
+        """
+        if self._requested_fields is not None:
+            return self._requested_fields
+        request = self.context.get("request")
+        if (
+            request is None
+            or self.sparse_fields_param is None
+            or request.method not in SAFE_METHODS
+            or not self._is_top_level()
+        ):
+            return None
+        params = getattr(request, "query_params", request.GET)
+        value = params.get(self.sparse_fields_param)
+        if not value:
+            return None
+        return {name.strip() for name in value.split(",") if name.strip()}
 
-    def _create_dynamic_field(self, field_name, field_schema):
-        field_type = field_schema.get("type")
-        field_args = {
-            "required": field_name in self.extension_schema.schema.get("required", []),
-            "allow_null": not field_schema.get("required", False),
-            "label": field_schema.get("title", field_name),
-            "help_text": field_schema.get("description", ""),
-        }
+    def _is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def _get_stored_schema(self, instance):
+        """
+        Returns the schema version the instance's extended data was
+        written against, looking up each version once per serializer.
+        """
+        version = getattr(instance, "extended_schema_version", None)
+        latest = self.extension_schema
+        if version is None or latest is None or version == latest.version:
+            return latest
+        schemas = self.__dict__.setdefault("_stored_schemas", {})
+        if version not in schemas:
+            schema = self.Meta.model.get_schema_version(self.tenant, version)
+            schemas[version] = schema or latest
+        return schemas[version]
 
-        if field_type == "string":
-            if field_schema.get("format") == "date":
-                return serializers.DateField(**field_args)
-            elif field_schema.get("format") == "time":
-                return serializers.TimeField(**field_args)
-            elif field_schema.get("format") == "date-time":
-                return serializers.DateTimeField(**field_args)
-            elif field_schema.get("format") == "email":
-                return serializers.EmailField(**field_args)
-            elif field_schema.get("format") == "uri":
-                return serializers.URLField(**field_args)
-            elif "enum" in field_schema:
-                return serializers.ChoiceField(
-                    choices=[(choice, choice) for choice in field_schema["enum"]],
-                    **field_args,
-                )
-            else:
-                return serializers.CharField(**field_args)
-        elif field_type == "number":
-            return serializers.FloatField(**field_args)
-        elif field_type == "integer":
-            return serializers.IntegerField(**field_args)
-        elif field_type == "boolean":
-            return serializers.BooleanField(**field_args)
-        elif field_type == "array":
-            if "items" in field_schema and "enum" in field_schema["items"]:
-                return serializers.MultipleChoiceField(
-                    choices=[
-                        (choice, choice) for choice in field_schema["items"]["enum"]
-                    ],
-                    **field_args,
-                )
-            return serializers.ListField(**field_args)
-
-        return serializers.JSONField(**field_args)
+    def _get_representation_cache(self):
+        if not self.cache_representation or self.get_requested_fields() is not None:
+            return None
+        return get_representation_cache()
+
+    def _get_representation_key(self, instance):
+        schema_version = (
+            self.extension_schema.version if self.extension_schema else None
+        )
+        if instance.pk is None or instance.extended_schema_version != schema_version:
+            # Rows written against another version are rendered as usual
+            return None
+        return representation_key(self._get_representation_name(), instance)
+
+    def to_representation_many(self, instances):
+        """
+        Renders a list of instances, reading and writing the cached
+        representations of all of them at once.
+        """
+        cache = self._get_representation_cache()
+        if cache is None:
+            return [self.to_representation(instance) for instance in instances]
+        keys = [self._get_representation_key(instance) for instance in instances]
+        cached = cache.get_many([key for key in keys if key is not None])
+        results = []
+        missing = {}
+        for instance, key in zip(instances, keys):
+            ret = cached.get(key)
+            if ret is None:
+                ret = self._render(instance)
+                if key is not None:
+                    missing[key] = ret
+            results.append(ret)
+        if missing:
+            cache.set_many(missing, get_representation_cache_timeout())
+        return results
 
     def to_representation(self, instance):
+        cache = self._get_representation_cache()
+        key = self._get_representation_key(instance) if cache is not None else None
+        if key is None:
+            return self._render(instance)
+        ret = cache.get(key)
+        if ret is None:
+            ret = self._render(instance)
+            cache.set(key, ret, get_representation_cache_timeout())
+        return ret
+
+    def _render(self, instance):
         ret = super().to_representation(instance)
         if hasattr(instance, "extended_data"):
-            ret.update(instance.extended_data or {})
+            extended_data = instance.extended_data or {}
+            requested = self.get_requested_fields()
+            stored = self._get_stored_schema(instance)
+            if stored is not None and stored is not self.extension_schema:
+                # Render the fields of the version the row was written
+                # against, rather than those of the latest version
+                plan = get_field_plan(stored.compiled)
+                for field_name in self.extension_schema.compiled.properties:
+                    if field_name not in plan:
+                        ret.pop(field_name, None)
+                for field_name in plan:
+                    if requested is None or field_name in requested:
+                        ret.setdefault(field_name, None)
+            if requested is not None:
+                extended_data = {
+                    k: v for k, v in extended_data.items() if k in requested
+                }
+            ret.update(extended_data)
         return ret
 
     def to_internal_value(self, data):
         ret = super().to_internal_value(data)
         if self.extension_schema:
             extended_data = {}
-            for field_name, field_schema in self.extension_schema.schema.get(
-                "properties", {}
-            ).items():
+            properties = self.extension_schema.compiled.properties
+            for field_name, field_schema in properties.items():
                 if field_name in data:
                     value = data[field_name]
                     field_type = field_schema.get("type")
@@ -139,7 +295,7 @@ class ExtensibleModelSerializerMixin(serializers.ModelSerializer):
                         )
                     extended_data[field_name] = value
             try:
-                validate_extended_data(extended_data, self.extension_schema.schema)
+                validate_extended_data(extended_data, self.extension_schema.compiled)
             except ValidationError as e:
                 raise serializers.ValidationError({"extended_data": str(e)})
             ret["extended_data"] = extended_data
@@ -163,45 +319,89 @@ class ExtensibleModelSerializerMixin(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         extended_data = validated_data.pop("extended_data", {})
-        instance = super().update(instance, validated_data)
+        serializers.raise_errors_on_nested_writes("update", self, validated_data)
+        expected_revision = self._get_expected_revision()
 
-        if extended_data:
-            if not isinstance(instance.extended_data, dict):
-                instance.extended_data = {}
+        # Save only the model fields that were given, so that the stale
+        # extended_data of this instance cannot overwrite concurrent
+        # changes. Extended keys are merged by update_extended().
+        info = model_meta.get_field_info(instance)
+        concrete_fields = {field.name for field in instance._meta.concrete_fields}
+        update_fields = []
+        m2m_fields = []
+        for attr, value in validated_data.items():
+            if attr in info.relations and info.relations[attr].to_many:
+                m2m_fields.append((attr, value))
+            elif attr in concrete_fields:
+                setattr(instance, attr, value)
+                update_fields.append(attr)
 
+        if extended_data:
             # Convert date objects to ISO format strings
             for key, value in extended_data.items():
                 if isinstance(value, (date, datetime)):
                     extended_data[key] = value.isoformat()
 
-            instance.extended_data.update(extended_data)
+            # Use DjangoJSONEncoder to ensure all types are properly serialized
+            extended_data = json.loads(json.dumps(extended_data, cls=DjangoJSONEncoder))
 
-            # Use DjangoJSONEncoder when saving to ensure all types are properly serialized
-            instance.extended_data = json.loads(
-                json.dumps(instance.extended_data, cls=DjangoJSONEncoder)
-            )
-
-            instance.save()
+        try:
+            # A stale revision rolls back the model fields as well
+            with transaction.atomic(using=router.db_for_write(instance.__class__)):
+                if update_fields:
+                    instance.save(update_fields=update_fields)
+                for attr, value in m2m_fields:
+                    getattr(instance, attr).set(value)
+                if extended_data:
+                    instance.update_extended(
+                        extended_data, expected_revision=expected_revision
+                    )
+        except ConcurrentUpdateError as e:
+            raise serializers.ValidationError({"extended_revision": str(e)})
 
         return instance
 
+    def _get_expected_revision(self):
+        """
+        Clients may send the extended_revision they last read to have the
+        update rejected if the record changed since, instead of merged.
+        """
+        revision = getattr(self, "initial_data", {}).get("extended_revision")
+        if revision in (None, ""):
+            return None
+        try:
+            return int(revision)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {"extended_revision": "A valid integer is required."}
+            )
+
     def validate(self, attrs):
         attrs = super().validate(attrs)
         if self.extension_schema:
             extended_data = attrs.get("extended_data", {})
             try:
-                validate_extended_data(extended_data, self.extension_schema.schema)
+                validate_extended_data(extended_data, self.extension_schema.compiled)
             except ValidationError as e:
                 raise serializers.ValidationError({"extended_data": str(e)})
         return attrs
 
     def get_fields(self):
         fields = super().get_fields()
+        requested = self.get_requested_fields()
+        if requested is not None:
+            fields = {
+                name: field for name, field in fields.items() if name in requested
+            }
         if self.extension_schema:
-            for field_name, field_schema in self.extension_schema.schema.get(
-                "properties", {}
-            ).items():
-                fields[field_name] = self._create_dynamic_field(
-                    field_name, field_schema
-                )
+            plan = get_field_plan(self.extension_schema.compiled)
+            for field_name, (field_class, field_args) in plan.items():
+                if requested is None or field_name in requested:
+                    fields[field_name] = field_class(**field_args)
         return fields
+
+
+class ExtensibleListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return self.child.to_representation_many(list(iterable))
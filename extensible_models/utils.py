@@ -8,6 +8,9 @@ from django.conf import settings
 from django.core.validators import URLValidator, EmailValidator
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 
+from .schemas import compile_schema, get_validator
+from .validation import get_fast_validator, get_property_validators
+
 
 def get_tenant_model():
     try:
@@ -27,14 +30,23 @@ def get_tenant_field():
         )
 
 
-def validate_extended_data(instance, schema, is_creation=False):
-    validation_schema = schema.copy()
-    if is_creation:
-        validation_schema.pop("required", None)
-        for prop in validation_schema.get("properties", {}).values():
-            if prop.get("type") == "array":
-                prop.pop("minItems", None)
+def get_model_tenant_field(model):
+    """
+    Returns the name of the foreign key from an extensible model to the
+    tenant model.
+    """
+    tenant_model = get_tenant_model()
+    for field in model._meta.fields:
+        if (
+            field.is_relation
+            and field.many_to_one
+            and field.related_model == tenant_model
+        ):
+            return field.name
+    raise AttributeError(f"No tenant field found for model {model.__name__}")
+
 
+def _convert_temporal_values(instance):
     # Convert datetime.time objects to string before validation
     for field, value in instance.items():
         if isinstance(value, time):
@@ -44,10 +56,52 @@ def validate_extended_data(instance, schema, is_creation=False):
         elif isinstance(value, datetime):
             instance[field] = value.isoformat()
 
-    try:
-        jsonschema.validate(instance=instance, schema=validation_schema)
-    except jsonschema.exceptions.ValidationError as e:
-        raise ValidationError(f"Extended data validation error: {e}")
+
+def validate_extended_data(instance, schema, is_creation=False):
+    _convert_temporal_values(instance)
+
+    # Schemas within the simple subset are checked by a compiled fast
+    # path; jsonschema then only runs to report why an instance is invalid.
+    is_valid = get_fast_validator(schema, is_creation=is_creation)
+    if is_valid is not None and is_valid(instance):
+        return
+
+    validator = get_validator(schema, is_creation=is_creation)
+    error = jsonschema.exceptions.best_match(validator.iter_errors(instance))
+    if error is not None:
+        raise ValidationError(f"Extended data validation error: {error}")
+
+
+def validate_extended_changes(changes, remove, schema):
+    """
+    Validates only the keys that `changes` sets and `remove` drops, as
+    changes to an existing document. Returns False, without validating,
+    if the schema has keywords relating several keys (anything outside
+    the fast-path subset), in which case the whole document must be
+    validated instead.
+    """
+    validators = get_property_validators(schema)
+    if validators is None:
+        return False
+    _convert_temporal_values(changes)
+    required = compile_schema(schema).required
+    for name in remove:
+        if name in required:
+            raise ValidationError(
+                f"Extended data validation error: '{name}' is a required property"
+            )
+    invalid = {
+        name: value
+        for name, value in changes.items()
+        if name in validators and not validators[name](value)
+    }
+    if invalid:
+        # Report the first property error, as validate_extended_data() does
+        validator = get_validator(schema)
+        errors = (error for error in validator.iter_errors(invalid) if error.path)
+        error = jsonschema.exceptions.best_match(errors)
+        raise ValidationError(f"Extended data validation error: {error}")
+    return True
 
 
 def create_form_field(field_name, field_schema):
@@ -0,0 +1,532 @@
+import os
+import re
+import numbers
+import operator
+from itertools import islice
+from collections import deque
+from datetime import date, time
+from concurrent.futures import ProcessPoolExecutor
+
+import jsonschema
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import schemas
+from .schemas import _LRUCache, compile_schema, get_validation_schema
+
+# Keywords that never affect validation (formats are not asserted by
+# jsonschema's default validators either).
+ANNOTATION_KEYWORDS = frozenset(
+    {"title", "description", "default", "examples", "format", "$comment"}
+    | {"readOnly", "writeOnly", "deprecated"}
+)
+
+PROPERTY_KEYWORDS = frozenset(
+    {"type", "enum", "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum"}
+    | {"minLength", "maxLength", "pattern", "items", "minItems", "maxItems"}
+)
+
+# Drafts whose semantics for the keywords above are identical.
+SUPPORTED_DRAFTS = frozenset(
+    {
+        "http://json-schema.org/draft-06/schema",
+        "http://json-schema.org/draft-07/schema",
+        "https://json-schema.org/draft/2019-09/schema",
+        "https://json-schema.org/draft/2020-12/schema",
+    }
+)
+
+
+class UnsupportedSchema(Exception):
+    """
+    Raised when a schema uses features outside the fast-path subset.
+    """
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def _is_integer(value):
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+
+
+TYPE_CHECKS = {
+    "string": lambda value: isinstance(value, str),
+    "number": _is_number,
+    "integer": _is_integer,
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+    "null": lambda value: value is None,
+}
+
+
+def _enum_check(values):
+    """
+    Compiles an enum of scalars into set lookups that follow jsonschema's
+    equality rules (True is not 1, but 1 is 1.0).
+    """
+    if not isinstance(values, (list, tuple)):
+        raise UnsupportedSchema("enum")
+    for value in values:
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise UnsupportedSchema("enum")
+    strings = frozenset(v for v in values if isinstance(v, str))
+    booleans = tuple(v for v in values if isinstance(v, bool))
+    scalars = frozenset(
+        v for v in values if not isinstance(v, (str, bool))
+    )  # numbers and None
+
+    def check(value):
+        if isinstance(value, str):
+            return value in strings
+        if isinstance(value, bool):
+            return value in booleans
+        if isinstance(value, (list, dict)):
+            return False
+        try:
+            return value in scalars
+        except TypeError:
+            return False
+
+    return check
+
+
+def _compile_property(schema):
+    """
+    Compiles a property schema into a single predicate. Range, length
+    and pattern checks only apply to values of the matching type, as in
+    jsonschema.
+    """
+    if schema is True:
+        return lambda value: True
+    if not isinstance(schema, dict):
+        raise UnsupportedSchema("property")
+    unsupported = set(schema) - PROPERTY_KEYWORDS - ANNOTATION_KEYWORDS
+    if unsupported:
+        raise UnsupportedSchema(", ".join(sorted(unsupported)))
+
+    checks = []
+    if "type" in schema:
+        if not isinstance(schema["type"], str) or schema["type"] not in TYPE_CHECKS:
+            raise UnsupportedSchema("type")
+        checks.append(TYPE_CHECKS[schema["type"]])
+    if "enum" in schema:
+        checks.append(_enum_check(schema["enum"]))
+
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    exclusive_minimum = schema.get("exclusiveMinimum")
+    exclusive_maximum = schema.get("exclusiveMaximum")
+    if minimum is not None:
+        checks.append(lambda value: not _is_number(value) or value >= minimum)
+    if maximum is not None:
+        checks.append(lambda value: not _is_number(value) or value <= maximum)
+    if exclusive_minimum is not None:
+        checks.append(lambda value: not _is_number(value) or value > exclusive_minimum)
+    if exclusive_maximum is not None:
+        checks.append(lambda value: not _is_number(value) or value < exclusive_maximum)
+
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    if min_length is not None:
+        checks.append(
+            lambda value: not isinstance(value, str) or len(value) >= min_length
+        )
+    if max_length is not None:
+        checks.append(
+            lambda value: not isinstance(value, str) or len(value) <= max_length
+        )
+    if "pattern" in schema:
+        search = re.compile(schema["pattern"]).search
+        checks.append(
+            lambda value: not isinstance(value, str) or search(value) is not None
+        )
+
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    if min_items is not None:
+        checks.append(
+            lambda value: not isinstance(value, list) or len(value) >= min_items
+        )
+    if max_items is not None:
+        checks.append(
+            lambda value: not isinstance(value, list) or len(value) <= max_items
+        )
+    if "items" in schema:
+        item_check = _compile_property(schema["items"])
+        checks.append(
+            lambda value: not isinstance(value, list)
+            or all(item_check(item) for item in value)
+        )
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value):
+        for predicate in checks:
+            if not predicate(value):
+                return False
+        return True
+
+    return check
+
+
+def compile_fast_validator(schema):
+    """
+    Compiles a flat object schema (properties with type, format, enum,
+    range, length, pattern and simple items constraints, plus a
+    required list) into a predicate returning whether an instance is
+    valid. Raises UnsupportedSchema for anything outside that subset.
+    """
+    draft = schema.get("$schema")
+    if draft is not None and draft.rstrip("#") not in SUPPORTED_DRAFTS:
+        raise UnsupportedSchema("$schema")
+    unsupported = (
+        set(schema) - {"type", "properties", "required", "$schema"}
+    ) - ANNOTATION_KEYWORDS
+    if unsupported:
+        raise UnsupportedSchema(", ".join(sorted(unsupported)))
+    if schema.get("type", "object") != "object":
+        raise UnsupportedSchema("type")
+
+    require_object = "type" in schema
+    required = tuple(schema.get("required", ()))
+    properties = tuple(
+        (name, _compile_property(prop_schema))
+        for name, prop_schema in schema.get("properties", {}).items()
+    )
+
+    def is_valid(instance):
+        if not isinstance(instance, dict):
+            return not require_object
+        for name in required:
+            if name not in instance:
+                return False
+        for name, check in properties:
+            if name in instance and not check(instance[name]):
+                return False
+        return True
+
+    return is_valid
+
+
+_fast_validators = _LRUCache(schemas.get_compiled_schema_cache_size())
+_UNSUPPORTED = object()
+
+
+def get_fast_validator(schema, is_creation=False):
+    """
+    Returns the cached fast-path predicate for a schema, or None if the
+    schema is outside the supported subset (or validation is being
+    profiled), in which case the jsonschema validator must be used.
+    """
+    if schemas._active_profile is not None:
+        return None
+    compiled = compile_schema(schema)
+    key = (compiled.hash, is_creation)
+    is_valid = _fast_validators.get(key)
+    if is_valid is None:
+        validation_schema = get_validation_schema(compiled, is_creation)
+        jsonschema.validators.validator_for(validation_schema).check_schema(
+            validation_schema
+        )
+        try:
+            is_valid = compile_fast_validator(validation_schema)
+        except (UnsupportedSchema, re.error):
+            is_valid = _UNSUPPORTED
+        _fast_validators.set(key, is_valid)
+    return None if is_valid is _UNSUPPORTED else is_valid
+
+
+_property_validators = _LRUCache(schemas.get_compiled_schema_cache_size())
+
+
+def get_property_validators(schema):
+    """
+    Returns the cached fast-path predicate of each property of a schema,
+    for checking changed values on their own, or None under the same
+    conditions as get_fast_validator(). Properties of such schemas are
+    independent of each other, so untouched values need no re-check.
+    """
+    if get_fast_validator(schema) is None:
+        return None
+    compiled = compile_schema(schema)
+    validators = _property_validators.get(compiled.hash)
+    if validators is None:
+        validation_schema = get_validation_schema(compiled)
+        validators = _property_validators.set(
+            compiled.hash,
+            {
+                name: _compile_property(prop_schema)
+                for name, prop_schema in validation_schema.get("properties", {}).items()
+            },
+        )
+    return validators
+
+
+# Columns shorter than this are checked in pure Python even when NumPy
+# is available, as building the arrays would cost more than it saves.
+NUMPY_MIN_COLUMN_LENGTH = 64
+
+# Integers beyond this magnitude do not round-trip through float64.
+_EXACT_FLOAT_LIMIT = 2**53
+
+# Each bound is paired with the comparison that detects a violation.
+_NUMBER_BOUNDS = (
+    ("minimum", operator.lt),
+    ("maximum", operator.gt),
+    ("exclusiveMinimum", operator.le),
+    ("exclusiveMaximum", operator.ge),
+)
+_LENGTH_BOUNDS = (("minLength", operator.lt), ("maxLength", operator.gt))
+_RESIDUAL_KEYWORDS = ("enum", "pattern", "items", "minItems", "maxItems")
+
+
+def _bound_violations(pairs, bounds):
+    """
+    Returns the indices of the (index, value) pairs whose value violates
+    any of the bounds, comparing whole columns at once with NumPy when
+    that is exact.
+    """
+    if not pairs or not bounds:
+        return []
+    if numpy is not None and len(pairs) >= NUMPY_MIN_COLUMN_LENGTH:
+        indices, values = zip(*pairs)
+        array = numpy.array(values)
+        if (
+            array.dtype.kind in "iuf"
+            and numpy.abs(array).max() < _EXACT_FLOAT_LIMIT
+            and all(abs(bound) < _EXACT_FLOAT_LIMIT for bound, _ in bounds)
+        ):
+            mask = numpy.zeros(len(array), dtype=bool)
+            for bound, violates in bounds:
+                mask |= violates(array, bound)
+            return numpy.asarray(indices)[mask].tolist()
+    return [
+        index
+        for index, value in pairs
+        if any(violates(value, bound) for bound, violates in bounds)
+    ]
+
+
+def _compile_column(schema):
+    """
+    Compiles a property schema into a function taking the row indices
+    and values of a column and returning the indices of invalid values.
+    Types, numeric ranges and lengths are checked column-wise; other
+    constraints fall back to the per-value fast-path predicate.
+    """
+    if schema is True:
+        return lambda indices, values: ()
+    _compile_property(schema)  # Raises UnsupportedSchema outside the subset
+
+    type_check = TYPE_CHECKS.get(schema.get("type"))
+    number_bounds = [
+        (schema[keyword], violates)
+        for keyword, violates in _NUMBER_BOUNDS
+        if schema.get(keyword) is not None
+    ]
+    length_bounds = [
+        (schema[keyword], violates)
+        for keyword, violates in _LENGTH_BOUNDS
+        if schema.get(keyword) is not None
+    ]
+    residual = {k: v for k, v in schema.items() if k in _RESIDUAL_KEYWORDS}
+    residual_check = _compile_property(residual) if residual else None
+
+    def check(indices, values):
+        invalid = []
+        if type_check is not None:
+            invalid.extend(
+                i for i, value in zip(indices, values) if not type_check(value)
+            )
+        if number_bounds:
+            numbers = [
+                (i, value) for i, value in zip(indices, values) if _is_number(value)
+            ]
+            invalid.extend(_bound_violations(numbers, number_bounds))
+        if length_bounds:
+            lengths = [
+                (i, len(value))
+                for i, value in zip(indices, values)
+                if isinstance(value, str)
+            ]
+            invalid.extend(_bound_violations(lengths, length_bounds))
+        if residual_check is not None:
+            invalid.extend(
+                i for i, value in zip(indices, values) if not residual_check(value)
+            )
+        return invalid
+
+    return check
+
+
+def compile_column_validator(schema):
+    """
+    Compiles a schema in the fast-path subset into a function that takes
+    a list of instances and returns the set of indices of the invalid
+    ones, checking one property column at a time.
+    """
+    compile_fast_validator(schema)  # Raises UnsupportedSchema outside the subset
+    require_object = "type" in schema
+    required = tuple(schema.get("required", ()))
+    columns = tuple(
+        (name, _compile_column(prop_schema))
+        for name, prop_schema in schema.get("properties", {}).items()
+    )
+
+    def invalid_rows(instances):
+        rows = [
+            (index, instance)
+            for index, instance in enumerate(instances)
+            if isinstance(instance, dict)
+        ]
+        invalid = set()
+        if require_object and len(rows) != len(instances):
+            invalid.update(
+                index
+                for index, instance in enumerate(instances)
+                if not isinstance(instance, dict)
+            )
+        for name in required:
+            invalid.update(index for index, instance in rows if name not in instance)
+        for name, check in columns:
+            indices = [index for index, instance in rows if name in instance]
+            if indices:
+                values = [instances[index][name] for index in indices]
+                invalid.update(check(indices, values))
+        return invalid
+
+    return invalid_rows
+
+
+_column_validators = _LRUCache(schemas.get_compiled_schema_cache_size())
+
+
+def get_column_validator(schema, is_creation=False):
+    """
+    Returns the cached column-wise validator for a schema, or None if
+    the schema is outside the fast-path subset (or validation is being
+    profiled).
+    """
+    if schemas._active_profile is not None:
+        return None
+    compiled = compile_schema(schema)
+    key = (compiled.hash, is_creation)
+    invalid_rows = _column_validators.get(key)
+    if invalid_rows is None:
+        validation_schema = get_validation_schema(compiled, is_creation)
+        try:
+            invalid_rows = compile_column_validator(validation_schema)
+        except (UnsupportedSchema, re.error):
+            invalid_rows = _UNSUPPORTED
+        _column_validators.set(key, invalid_rows)
+    return None if invalid_rows is _UNSUPPORTED else invalid_rows
+
+
+def validate_batch(instances, schema, is_creation=False):
+    """
+    Validates a batch of extended data dicts and returns a dict mapping
+    the index of every invalid instance to its error messages. Valid
+    instances are not included.
+
+    Validity is the same as for validate_extended_data(). Schemas in the
+    fast-path subset are checked column-wise; jsonschema then only runs
+    on the invalid instances, to report their errors.
+    """
+    instances = list(instances)
+    for instance in instances:
+        if isinstance(instance, dict):
+            for field, value in instance.items():
+                if isinstance(value, (date, time)):
+                    instance[field] = value.isoformat()
+
+    invalid_rows = get_column_validator(schema, is_creation=is_creation)
+    if invalid_rows is None:
+        candidates = range(len(instances))
+    else:
+        candidates = sorted(invalid_rows(instances))
+
+    validator = schemas.get_validator(schema, is_creation=is_creation)
+    errors = {}
+    for index in candidates:
+        messages = [error.message for error in validator.iter_errors(instances[index])]
+        if messages:
+            errors[index] = messages
+    return errors
+
+
+# Set in each validate_many() worker process by the pool initializer.
+_worker_schema = None
+_worker_is_creation = False
+
+
+def _init_worker(schema, is_creation):
+    global _worker_schema, _worker_is_creation
+    _worker_schema = compile_schema(schema)
+    _worker_is_creation = is_creation
+    # Compile the validators once, up front, rather than on the first chunk
+    schemas.get_validator(_worker_schema, is_creation=is_creation)
+    get_column_validator(_worker_schema, is_creation=is_creation)
+
+
+def _validate_chunk(instances):
+    return validate_batch(instances, _worker_schema, is_creation=_worker_is_creation)
+
+
+def _chunks(instances, chunk_size):
+    instances = iter(instances)
+    while True:
+        chunk = list(islice(instances, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_many(instances, schema, is_creation=False, workers=None, chunk_size=500):
+    """
+    Validates an iterable of extended data dicts across a pool of worker
+    processes and yields, in order, the list of error messages of each
+    instance (empty if it is valid).
+
+    The schema is sent to each worker once, where its validators are
+    compiled and kept for the life of the pool. Instances are consumed
+    lazily and sent to the workers in chunks of chunk_size, with at most
+    two chunks per worker in flight. With workers=1, validation runs in
+    the calling process. workers defaults to the number of CPUs.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(instances, chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            errors = validate_batch(chunk, schema, is_creation=is_creation)
+            for index in range(len(chunk)):
+                yield errors.get(index, [])
+        return
+
+    schema = compile_schema(schema).to_dict()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(schema, is_creation),
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), executor.submit(_validate_chunk, chunk)))
+            if len(pending) >= workers * 2:
+                yield from _chunk_results(*pending.popleft())
+        while pending:
+            yield from _chunk_results(*pending.popleft())
+
+
+def _chunk_results(size, future):
+    errors = future.result()
+    for index in range(size):
+        yield errors.get(index, [])
@@ -1,6 +1,12 @@
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
+from .exporters import EXPORT_CONTENT_TYPES, export_response
+from .importers import IMPORT_FORMATS, import_rows, parse_rows
+from .resolvers import resolve_tenant
+
 
 class ExtensibleModelViewSetMixin:
 
@@ -29,3 +35,75 @@ class ExtensibleModelViewSetMixin:
         if serializer.extension_schema:
             data["extension_schema"] = serializer.extension_schema.schema
         return Response(data)
+
+
+class ExtensibleModelExportMixin:
+    """
+    Adds an `export` action that streams the (filtered) queryset as CSV
+    or JSON lines, with extended fields flattened into columns. The
+    format is chosen with the `export_format` query parameter.
+    """
+
+    export_fields = None
+    export_filename = "export"
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {"detail": f"Unsupported export format: {export_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return export_response(
+            self.filter_queryset(self.get_queryset()),
+            tenant=resolve_tenant(request),
+            fields=self.export_fields,
+            format=export_format,
+            filename=self.export_filename,
+        )
+
+
+class ExtensibleModelImportMixin:
+    """
+    Adds an `import` action that bulk creates records from an uploaded
+    CSV or JSON lines file (the `file` form field) for the requesting
+    tenant, and responds with per-row errors and throughput figures.
+    """
+
+    import_batch_size = 1000
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+    )
+    def import_records(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"detail": "No file was uploaded."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        import_format = request.query_params.get(
+            "import_format", upload.name.rpartition(".")[2].lower()
+        )
+        if import_format not in IMPORT_FORMATS:
+            return Response(
+                {"detail": f"Unsupported import format: {import_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        tenant = resolve_tenant(request)
+        if tenant is None:
+            return Response(
+                {"detail": "Records can only be imported for a tenant."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = import_rows(
+            self.get_queryset().model,
+            parse_rows(upload, format=import_format),
+            tenant=tenant,
+            batch_size=self.import_batch_size,
+        )
+        return Response(result.as_dict())
@@ -13,6 +13,11 @@ setup(
         "jsonschema>=4.21.0",
         "djangorestframework>=3.14.0",
     ],
+    extras_require={
+        "msgpack": ["msgpack>=1.0"],
+        "numpy": ["numpy>=1.24"],
+        "orjson": ["orjson>=3.9"],
+    },
     classifiers=[
         "Environment :: Web Environment",
         "Framework :: Django",
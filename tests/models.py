@@ -1,5 +1,6 @@
 from django.db import models
 
+from extensible_models.fields import CompactJSONField
 from extensible_models.models import ExtensibleModelMixin
 
 
@@ -21,6 +22,18 @@ class ExampleModel(ExtensibleModelMixin, models.Model):
         return self.tenant
 
 
+class CompactExampleModel(ExtensibleModelMixin, models.Model):
+    name = models.CharField(max_length=100)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+    extended_data = CompactJSONField()
+
+    def __str__(self):
+        return self.name
+
+    def get_tenant(self):
+        return self.tenant
+
+
 class OtherModel(ExtensibleModelMixin, models.Model):
     name = models.CharField(max_length=100)
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
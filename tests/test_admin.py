@@ -0,0 +1,199 @@
+import pytest
+
+from django.contrib import admin
+from django.contrib.admin.utils import flatten_fieldsets
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from extensible_models.admin import ExtensibleModelAdminMixin, extended_list_filter
+from extensible_models.models import EXTENDED_DATA_FIELDS, ExtensionSchema
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+
+class ExampleModelAdmin(ExtensibleModelAdminMixin, admin.ModelAdmin):
+    list_display = ("name",)
+    extended_list_display = ("status", "amount", "missing")
+    extended_list_filter = ("status",)
+    extended_search_fields = ("status",)
+
+
+class TestExtensibleModelAdmin(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant 1")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string", "enum": ["open", "closed"]},
+                    "amount": {"type": "number"},
+                },
+            },
+        )
+        for name, status, amount in [("a", "open", 3), ("b", "closed", 1)]:
+            ExampleModel.objects.create(
+                name=name,
+                tenant=self.tenant,
+                extended_data={"status": status, "amount": amount},
+            )
+        self.model_admin = ExampleModelAdmin(ExampleModel, admin.site)
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def get_request(self, path="/", params=None):
+        request = RequestFactory().get(path, params or {})
+        request.user = self.user
+        request.tenant = self.tenant
+        return request
+
+    def get_changelist(self, params=None):
+        return self.model_admin.get_changelist_instance(self.get_request(params=params))
+
+    def test_changelist_columns(self):
+        changelist = self.get_changelist()
+        columns = [getattr(c, "__name__", c) for c in changelist.list_display]
+        assert columns == ["action_checkbox", "name", "status", "amount"]
+
+    def test_changelist_sorting(self):
+        changelist = self.get_changelist({"o": "-3"})
+        assert [obj.name for obj in changelist.queryset] == ["a", "b"]
+
+    def test_changelist_filter_and_search(self):
+        changelist = self.get_changelist({"extended_status": "closed"})
+        assert [obj.name for obj in changelist.queryset] == ["b"]
+        changelist = self.get_changelist({"q": "ope"})
+        assert [obj.name for obj in changelist.queryset] == ["a"]
+
+    def test_filter_choices_are_the_tenants_values(self):
+        other = Tenant.objects.create(name="Tenant 2")
+        ExampleModel.objects.create(
+            name="c", tenant=other, extended_data={"status": "open", "amount": 99}
+        )
+        prop = ExampleModel.get_latest_schema(self.tenant).compiled.properties
+        FilterClass = extended_list_filter(prop["amount"])
+        list_filter = FilterClass(
+            self.get_request(), {}, ExampleModel, self.model_admin
+        )
+        assert [float(value) for value, _ in list_filter.lookup_choices] == [1, 3]
+
+    def test_changelist_resolves_schema_once(self):
+        request = self.get_request()
+        with self.assertNumQueries(1):
+            self.model_admin.get_list_display(request)
+            self.model_admin.get_list_filter(request)
+            self.model_admin.get_search_fields(request)
+
+    def test_change_view_resolves_schema_once(self):
+        obj = ExampleModel.objects.get(name="a")
+        request = self.get_request()
+        with CaptureQueriesContext(connection) as context:
+            # The hooks called by ModelAdmin.change_view()
+            fieldsets = self.model_admin.get_fieldsets(request, obj)
+            FormClass = self.model_admin.get_form(
+                request, obj, change=True, fields=flatten_fieldsets(fieldsets)
+            )
+            form = FormClass(instance=obj)
+        schema_queries = [
+            query
+            for query in context.captured_queries
+            if ExtensionSchema._meta.db_table in query["sql"]
+        ]
+        assert len(schema_queries) == 1
+        assert form.initial["status"] == "open"
+
+    def test_add_view_resolves_schema_once(self):
+        request = self.get_request()
+        with CaptureQueriesContext(connection) as context:
+            # The hooks called by ModelAdmin.add_view()
+            fieldsets = self.model_admin.get_fieldsets(request)
+            FormClass = self.model_admin.get_form(
+                request, change=False, fields=flatten_fieldsets(fieldsets)
+            )
+            form = FormClass()
+        schema_queries = [
+            query
+            for query in context.captured_queries
+            if ExtensionSchema._meta.db_table in query["sql"]
+        ]
+        assert len(schema_queries) == 1
+        assert {"status", "amount"} <= set(form.fields)
+
+    def test_add_view_without_tenant(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        fieldsets = self.model_admin.get_fieldsets(request)
+        FormClass = self.model_admin.get_form(
+            request, change=False, fields=flatten_fieldsets(fieldsets)
+        )
+        form = FormClass()
+        assert "name" in form.fields
+        assert "status" not in form.fields
+
+    def post_change_form(self, obj, data):
+        request = RequestFactory().post("/", data)
+        request.user = self.user
+        request.tenant = self.tenant
+        fieldsets = self.model_admin.get_fieldsets(request, obj)
+        FormClass = self.model_admin.get_form(
+            request, obj, change=True, fields=flatten_fieldsets(fieldsets)
+        )
+        form = FormClass(data, instance=obj)
+        return request, form
+
+    def test_save_writes_only_changed_keys(self):
+        obj = ExampleModel.objects.get(name="a")
+        # Stored data that is invalid under the schema, but not edited
+        ExampleModel.objects.filter(pk=obj.pk).update(
+            extended_data={"status": "open", "amount": "n/a", "extra": 1}
+        )
+        obj = ExampleModel.objects.get(pk=obj.pk)
+        data = {"name": "a", "tenant": self.tenant.pk, "status": "closed"}
+        request, form = self.post_change_form(obj, data)
+        assert form.is_valid(), form.errors
+        assert form.cleaned_extended_data == {"status": "closed", "amount": None}
+
+        saved = []
+
+        def receiver(update_fields, **kwargs):
+            saved.append(update_fields)
+
+        post_save.connect(receiver, ExampleModel)
+        try:
+            with CaptureQueriesContext(connection) as context:
+                obj = form.save(commit=False)
+                self.model_admin.save_model(request, obj, form, True)
+        finally:
+            post_save.disconnect(receiver, ExampleModel)
+        updates = [q["sql"] for q in context.captured_queries if "UPDATE" in q["sql"]]
+        assert len(updates) == 1
+        assert '"name"' not in updates[0]
+        assert saved == [frozenset(["extended_data", *EXTENDED_DATA_FIELDS])]
+
+        obj.refresh_from_db()
+        assert obj.extended_data == {"status": "closed", "extra": 1}
+        assert obj.extended_revision == 1
+
+    def test_save_includes_fields_changed_outside_the_form(self):
+        obj = ExampleModel.objects.get(name="a")
+        data = {"name": "a", "tenant": self.tenant.pk, "status": "closed"}
+        request, form = self.post_change_form(obj, data)
+        assert form.is_valid(), form.errors
+        obj = form.save(commit=False)
+        obj.name = "set by save_model"
+        self.model_admin.save_model(request, obj, form, True)
+        obj.refresh_from_db()
+        assert obj.name == "set by save_model"
+        assert obj.extended_data["status"] == "closed"
+
+    def test_save_validates_changed_keys(self):
+        obj = ExampleModel.objects.get(name="a")
+        data = {"name": "a", "tenant": self.tenant.pk, "status": "pending"}
+        _, form = self.post_change_form(obj, data)
+        assert not form.is_valid()
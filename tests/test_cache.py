@@ -0,0 +1,70 @@
+import pytest
+
+from django.test import TestCase, override_settings
+from django.contrib.contenttypes.models import ContentType
+
+import extensible_models
+from extensible_models.cache import clear_schema_cache
+from extensible_models.models import ExtensionSchema
+from .models import Tenant, ExampleModel, OtherModel
+
+pytestmark = pytest.mark.django_db
+
+
+@override_settings(EXTENSIBLE_MODELS_SCHEMA_CACHE_TIMEOUT=None)
+class TestSchemaCache(TestCase):
+
+    def setUp(self):
+        clear_schema_cache()
+        self.tenant1 = Tenant.objects.create(name="Tenant 1")
+        self.tenant2 = Tenant.objects.create(name="Tenant 2")
+        self.content_type = ContentType.objects.get_for_model(ExampleModel)
+        for tenant in (self.tenant1, self.tenant2):
+            for field_name in ("field_v1", "field_v2"):
+                ExtensionSchema.objects.create(
+                    tenant=tenant,
+                    content_type=self.content_type,
+                    schema={
+                        "type": "object",
+                        "properties": {field_name: {"type": "string"}},
+                    },
+                )
+        clear_schema_cache()
+
+    def tearDown(self):
+        clear_schema_cache()
+
+    def test_warmup_loads_latest_schemas(self):
+        with self.assertNumQueries(1):
+            assert extensible_models.warmup(models=[ExampleModel]) == 2
+        with self.assertNumQueries(0):
+            schema = ExampleModel.get_latest_schema(self.tenant1)
+        assert schema.version == 2
+        assert "field_v2" in schema.compiled.properties
+
+    def test_warmup_limit(self):
+        ContentType.objects.get_for_model(OtherModel)
+        # The limit is reached before OtherModel's schemas are queried
+        with self.assertNumQueries(1):
+            assert (
+                extensible_models.warmup(models=[ExampleModel, OtherModel], limit=1)
+                == 1
+            )
+
+    @override_settings(EXTENSIBLE_MODELS_SCHEMA_CACHE_TIMEOUT=0)
+    def test_warmup_without_cache_timeout_warns(self):
+        with self.assertLogs("extensible_models.cache", "WARNING"):
+            assert extensible_models.warmup(models=[ExampleModel]) == 2
+        with self.assertNumQueries(1):
+            ExampleModel.get_latest_schema(self.tenant1)
+
+    def test_publishing_invalidates_cache(self):
+        extensible_models.warmup(models=[ExampleModel])
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field_v3": {"type": "string"}}},
+        )
+        assert ExampleModel.get_latest_schema(self.tenant1).version == 3
+        with self.assertNumQueries(0):
+            assert ExampleModel.get_latest_schema(self.tenant2).version == 2
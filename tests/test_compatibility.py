@@ -0,0 +1,192 @@
+import pytest
+
+from django.test import SimpleTestCase, TestCase
+from django.contrib.contenttypes.models import ContentType
+
+from extensible_models.compatibility import (
+    BREAKING,
+    EQUIVALENT,
+    NARROWING,
+    WIDENING,
+    affected_properties,
+    classify,
+    diff_schemas,
+)
+from extensible_models.models import ExtensionSchema
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+BASE = {
+    "type": "object",
+    "properties": {
+        "status": {"type": "string", "enum": ["open", "closed"], "title": "Status"},
+        "amount": {"type": "number", "minimum": 0, "maximum": 100},
+        "tags": {"type": "array", "items": {"type": "string", "maxLength": 5}},
+        "due": {"type": "string", "format": "date"},
+    },
+    "required": ["status"],
+}
+
+
+def changed(**properties):
+    schema = {**BASE, "properties": {**BASE["properties"], **properties}}
+    return {
+        **schema,
+        "properties": {k: v for k, v in schema["properties"].items() if v},
+    }
+
+
+class TestDiffSchemas(SimpleTestCase):
+
+    def assert_classified(self, new, expected, affected):
+        changes = diff_schemas(BASE, new)
+        assert classify(changes) == expected, changes
+        assert affected_properties(changes) == affected
+
+    def test_annotations_are_equivalent(self):
+        status = {**BASE["properties"]["status"], "title": "State"}
+        self.assert_classified(changed(status=status), EQUIVALENT, set())
+
+    def test_widening_changes(self):
+        for new in [
+            changed(note={"type": "string"}),
+            changed(amount={"type": "number", "minimum": -10}),
+            changed(amount={"type": "number", "minimum": 0, "maximum": 1000}),
+            changed(status={"type": "string", "enum": ["open", "closed", "held"]}),
+            changed(tags={"type": "array", "items": {"type": "string"}}),
+            changed(amount=None),
+            {**BASE, "required": []},
+        ]:
+            self.assert_classified(new, WIDENING, set())
+
+    def test_narrowing_changes(self):
+        for new, affected in [
+            ({**BASE, "required": ["status", "amount"]}, {"amount"}),
+            (changed(note={"type": "string"}) | {"required": ["note"]}, {"note"}),
+            (changed(status={"type": "string", "enum": ["open"]}), {"status"}),
+            (
+                changed(amount={"type": "number", "minimum": 1, "maximum": 100}),
+                {"amount"},
+            ),
+            (
+                changed(
+                    tags={"type": "array", "items": {"type": "string", "maxLength": 3}}
+                ),
+                {"tags"},
+            ),
+            (
+                changed(amount={"type": "integer", "minimum": 0, "maximum": 100}),
+                {"amount"},
+            ),
+            ({**BASE, "additionalProperties": False}, None),
+        ]:
+            self.assert_classified(new, NARROWING, affected)
+
+    def test_breaking_changes(self):
+        for new in [
+            changed(amount={"type": "string"}),
+            changed(status={"type": "string", "enum": ["draft"]}),
+            changed(due={"type": "string", "format": "date-time"}),
+        ]:
+            changes = diff_schemas(BASE, new)
+            assert classify(changes) == BREAKING, changes
+
+    def test_removed_property_left_to_additional_properties(self):
+        for additional, expected in [
+            (True, WIDENING),
+            ({}, WIDENING),
+            ({"type": "string"}, NARROWING),
+            (False, BREAKING),
+        ]:
+            old = {**BASE, "additionalProperties": additional}
+            new = {**changed(amount=None), "additionalProperties": additional}
+            changes = diff_schemas(old, new)
+            assert classify(changes) == expected, changes
+            assert affected_properties(changes) == (
+                set() if expected == WIDENING else {"amount"}
+            )
+
+        patterns = {"patternProperties": {"^am": {"type": "integer"}}}
+        changes = diff_schemas(BASE | patterns, changed(amount=None) | patterns)
+        assert classify(changes) == NARROWING, changes
+
+    def test_change_details(self):
+        changes = diff_schemas(BASE, changed(amount={"type": "number", "minimum": 5}))
+        assert changes == [
+            {
+                "change": WIDENING,
+                "property": "amount",
+                "keyword": "maximum",
+                "old": 100,
+                "new": None,
+            },
+            {
+                "change": NARROWING,
+                "property": "amount",
+                "keyword": "minimum",
+                "old": 0,
+                "new": 5,
+            },
+        ]
+
+
+class TestSchemaCompatibility(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        self.content_type = ContentType.objects.get_for_model(ExampleModel)
+
+    def create(self, schema):
+        return ExtensionSchema.objects.create(
+            tenant=self.tenant, content_type=self.content_type, schema=schema
+        )
+
+    def test_first_version_requires_full_revalidation(self):
+        schema = self.create(BASE)
+        assert schema.compatibility == ""
+        assert schema.get_affected_properties() is None
+
+    def test_new_version_records_changes(self):
+        self.create(BASE)
+        schema = self.create(changed(note={"type": "string"}))
+        assert schema.version == 2
+        assert schema.compatibility == WIDENING
+        assert schema.get_affected_properties() == set()
+
+        schema.schema = {**schema.schema, "required": ["status", "note"]}
+        schema.save()
+        schema.refresh_from_db()
+        assert schema.version == 3
+        assert schema.compatibility == NARROWING
+        assert schema.get_affected_properties() == {"note"}
+
+    def test_in_place_edit_is_diffed_against_the_active_schema(self):
+        short = {"type": "object", "properties": {"a": {"type": "string"}}}
+        short["properties"]["a"]["maxLength"] = 5
+        v1 = self.create(short)
+        self.create({"type": "object", "properties": {"a": {"type": "string"}}})
+
+        v1.schema = {**short, "properties": {**short["properties"], "c": {}}}
+        v1.save()
+        v1.refresh_from_db()
+        assert v1.version == 3
+        assert v1.compatibility == NARROWING
+        assert v1.get_affected_properties() == {"a"}
+
+    def test_staged_version_is_diffed_when_activated(self):
+        self.create(BASE)
+        staged = ExtensionSchema(
+            tenant=self.tenant,
+            content_type=self.content_type,
+            schema=changed(amount={"type": "number", "minimum": 10}),
+        )
+        staged.save(activate=False)
+        assert staged.compatibility == NARROWING
+
+        # A version published meanwhile already has the tighter bound
+        self.create(changed(amount={"type": "number", "minimum": 10, "maximum": 100}))
+        staged.activate()
+        staged.refresh_from_db()
+        assert staged.compatibility == WIDENING
+        assert staged.get_affected_properties() == set()
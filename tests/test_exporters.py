@@ -0,0 +1,66 @@
+import json
+import pytest
+
+from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+
+from extensible_models.exporters import export_rows
+from extensible_models.models import ExtensionSchema
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant 1")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string"},
+                    "tags": {"type": "array", "items": {"type": "string"}},
+                },
+            },
+        )
+        ExampleModel.objects.create(
+            name="First",
+            tenant=self.tenant,
+            extended_data={"tags": ["a", "b"], "status": "open"},
+        )
+        ExampleModel.objects.create(name="Second", tenant=self.tenant)
+
+    def test_csv_export(self):
+        lines = list(
+            export_rows(
+                ExampleModel.objects.order_by("pk"),
+                tenant=self.tenant,
+                fields=["name"],
+            )
+        )
+        assert lines == [
+            "name,status,tags\r\n",
+            'First,open,"[""a"",""b""]"\r\n',
+            "Second,,\r\n",
+        ]
+
+    def test_jsonl_export(self):
+        lines = list(
+            export_rows(
+                ExampleModel.objects.order_by("pk"),
+                tenant=self.tenant,
+                fields=["name"],
+                format="jsonl",
+            )
+        )
+        assert [json.loads(line) for line in lines] == [
+            {"name": "First", "status": "open", "tags": ["a", "b"]},
+            {"name": "Second", "status": None, "tags": None},
+        ]
+
+    def test_export_without_schema(self):
+        lines = list(export_rows(ExampleModel.objects.order_by("pk"), fields=["name"]))
+        assert lines[0] == "name,extended_data\r\n"
@@ -0,0 +1,159 @@
+import json
+
+import pytest
+
+from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.contrib.contenttypes.models import ContentType
+
+from extensible_models import fields
+from extensible_models.fields import decode, encode, is_raw
+from extensible_models.models import ExtensionSchema
+from .models import Tenant, CompactExampleModel, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "status": {"type": "string"},
+        "amount": {"type": "number"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+
+class TestCompactJSONField(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        self.schema = ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(CompactExampleModel),
+            schema=SCHEMA,
+        )
+        self.data = {"status": "open", "amount": 2.5, "tags": ["a"], "legacy": None}
+
+    def test_round_trip(self):
+        for codec in (fields.CODEC_JSON, fields.CODEC_MSGPACK):
+            for compiled in (None, self.schema.compiled):
+                encoded = encode(self.data, compiled, codec=codec)
+                assert encoded[0] == codec
+                assert decode(encoded) == self.data
+
+    def test_codec_is_chosen_by_setting(self):
+        assert encode(self.data)[0] == fields.CODEC_JSON
+        with self.settings(EXTENSIBLE_MODELS_COMPACT_CODEC="msgpack"):
+            assert encode(self.data)[0] == fields.CODEC_MSGPACK
+            with pytest.MonkeyPatch.context() as mp:
+                mp.setattr(fields, "msgpack", None)
+                with pytest.raises(ImproperlyConfigured):
+                    encode(self.data)
+
+    def test_schema_keys_are_not_stored(self):
+        encoded = encode(self.data, self.schema.compiled)
+        assert b"status" not in encoded
+        assert b"legacy" in encoded
+        assert len(encoded) < len(json.dumps(self.data)) + 34
+
+    def test_model_round_trip(self):
+        obj = CompactExampleModel.objects.create(
+            name="a", tenant=self.tenant, extended_data=self.data
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT extended_data FROM {CompactExampleModel._meta.db_table}"
+            )
+            raw = bytes(cursor.fetchone()[0])
+        assert raw[1] == fields.FLAG_KEYED
+
+        obj = CompactExampleModel.objects.get(pk=obj.pk)
+        assert obj.extended_data == self.data
+
+        obj.update_extended({"amount": 3})
+        obj.refresh_from_db()
+        assert obj.extended_data == {**self.data, "amount": 3}
+        assert list(
+            CompactExampleModel.objects.values_list("extended_data", flat=True)
+        ) == [obj.extended_data]
+
+    def test_key_table_is_loaded_from_database(self):
+        encoded = encode(self.data, self.schema.compiled)
+        fields._key_tables.clear()
+        with self.assertNumQueries(1):
+            assert decode(encoded) == self.data
+
+    def test_rows_outlive_the_schema_that_wrote_them(self):
+        obj = CompactExampleModel.objects.create(
+            name="a", tenant=self.tenant, extended_data=self.data
+        )
+        self.schema.schema = {"type": "object", "properties": {"other": {}}}
+        self.schema.save()
+        fields._key_tables.clear()
+        assert CompactExampleModel.objects.get(pk=obj.pk).extended_data == self.data
+
+        self.schema.delete()
+        fields._key_tables.clear()
+        assert CompactExampleModel.objects.get(pk=obj.pk).extended_data == self.data
+
+
+class TestLazyJSONField(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        self.pk = ExampleModel.objects.create(
+            name="a", tenant=self.tenant, extended_data={"status": "open"}
+        ).pk
+
+    def test_decoded_on_first_access(self):
+        obj = ExampleModel.objects.get(pk=self.pk)
+        assert is_raw(obj, "extended_data")
+        assert obj.extended_data == {"status": "open"}
+        assert not is_raw(obj, "extended_data")
+
+    def test_big_integers_are_decoded_exactly(self):
+        data = {"big": 2**70, "negative": -(2**70), "small": 1}
+        ExampleModel.objects.filter(pk=self.pk).update(extended_data=data)
+        obj = ExampleModel.objects.get(pk=self.pk)
+        assert obj.extended_data == data
+        assert isinstance(obj.extended_data["big"], int)
+
+    def test_untouched_data_is_not_written(self):
+        obj = ExampleModel.objects.get(pk=self.pk)
+        obj.name = "b"
+        with CaptureQueriesContext(connection) as context:
+            obj.save()
+        assert "extended_data" not in context.captured_queries[-1]["sql"]
+        obj = ExampleModel.objects.get(pk=self.pk)
+        assert obj.name == "b"
+        assert obj.extended_revision == 0
+
+        obj.extended_data["status"] = "closed"
+        obj.save()
+        obj = ExampleModel.objects.get(pk=self.pk)
+        assert obj.extended_data == {"status": "closed"}
+        assert obj.extended_revision == 1
+
+    def test_other_querysets_are_decoded(self):
+        obj = ExampleModel._base_manager.get(pk=self.pk)
+        assert not is_raw(obj, "extended_data")
+        assert ExampleModel._base_manager.values_list(
+            "extended_data", flat=True
+        ).get() == {"status": "open"}
+        row = Tenant.objects.values("examplemodel__extended_data").get()
+        assert row == {"examplemodel__extended_data": {"status": "open"}}
+        obj = ExampleModel.objects.annotate(data=F("extended_data")).get()
+        assert is_raw(obj, "extended_data")
+        assert obj.data == {"status": "open"}
+
+    def test_values_are_decoded(self):
+        queryset = ExampleModel.objects.filter(pk=self.pk)
+        expected = {"status": "open"}
+        assert queryset.values("extended_data")[0] == {"extended_data": expected}
+        assert queryset.values_list("name", "extended_data")[0] == ("a", expected)
+        assert queryset.values_list("extended_data", flat=True)[0] == expected
+        row = queryset.values_list("extended_data", named=True)[0]
+        assert row.extended_data == expected
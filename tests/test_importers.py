@@ -0,0 +1,139 @@
+import pytest
+
+from django.test import TestCase, override_settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import serializers, viewsets
+from rest_framework.test import APIRequestFactory
+
+from extensible_models.importers import build_converter, import_rows, parse_rows
+from extensible_models.models import ExtensionSchema
+from extensible_models.serializers import ExtensibleModelSerializerMixin
+from extensible_models.views import ExtensibleModelImportMixin
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+
+class ExampleSerializer(ExtensibleModelSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ExampleModel
+        fields = ["id", "name"]
+
+
+class ExampleViewSet(ExtensibleModelImportMixin, viewsets.ModelViewSet):
+    queryset = ExampleModel.objects.all()
+    serializer_class = ExampleSerializer
+    authentication_classes = []
+    permission_classes = []
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "amount": {"type": "integer", "minimum": 0},
+        "due": {"type": "string", "format": "date"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["amount"],
+}
+
+
+class TestImport(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant 1")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema=SCHEMA,
+        )
+
+    def test_converter(self):
+        converter = build_converter(SCHEMA)
+        assert converter({"amount": "3", "due": "2024-01-02", "tags": "a, b"}) == (
+            {"amount": 3, "due": "2024-01-02", "tags": ["a", "b"]},
+            {},
+        )
+        assert converter({"amount": "three", "due": ""}) == (
+            {},
+            {"amount": "Invalid value for amount"},
+        )
+
+    def test_csv_import(self):
+        source = [
+            b"name,amount,due,tags\n",
+            b"First,1,2024-01-02,a\n",
+            b"Second,-1,,\n",
+            b"Third,x,,\n",
+            b"Fourth,4,,\n",
+        ]
+        result = import_rows(
+            ExampleModel, parse_rows(source), tenant=self.tenant, batch_size=2
+        )
+        assert result.created == 2
+        assert sorted(result.errors) == [2, 3]
+        assert "extended_data" in result.errors[2]
+        assert result.errors[3] == {"amount": "Invalid value for amount"}
+        first = ExampleModel.objects.get(name="First")
+        assert first.tenant == self.tenant
+        assert first.extended_data == {"amount": 1, "due": "2024-01-02", "tags": ["a"]}
+
+    def test_jsonl_import(self):
+        source = ['{"name": "First", "amount": 2}\n', "\n", '{"amount": 3}\n']
+        result = import_rows(
+            ExampleModel, parse_rows(source, format="jsonl"), tenant=self.tenant
+        )
+        assert result.created == 1
+        assert list(result.errors) == [2]
+        assert "name" in result.errors[2]
+
+    def test_malformed_jsonl_lines_are_row_errors(self):
+        source = [
+            '{"name": "First", "amount": 2}\n',
+            "{not json\n",
+            "[1, 2]\n",
+            '{"name": "Last", "amount": 3}\n',
+        ]
+        result = import_rows(
+            ExampleModel,
+            parse_rows(source, format="jsonl"),
+            tenant=self.tenant,
+            batch_size=1,
+        )
+        assert result.created == 2
+        assert result.errors == {
+            2: {
+                "__all__": "Invalid JSON: Expecting property name enclosed in double quotes"
+            },
+            3: {"__all__": "Record must be a JSON object"},
+        }
+
+    def test_import_requires_a_tenant(self):
+        with pytest.raises(ValueError):
+            import_rows(ExampleModel, [{"name": "First", "amount": 2}], tenant=None)
+
+    def post_import(self, tenant=None, **headers):
+        upload = SimpleUploadedFile("rows.csv", b"name,amount\nFirst,1\n")
+        request = APIRequestFactory().post("/import/", {"file": upload}, **headers)
+        if tenant is not None:
+            request.tenant = tenant
+        view = ExampleViewSet.as_view({"post": "import_records"})
+        return view(request)
+
+    def test_import_view(self):
+        response = self.post_import(self.tenant)
+        assert response.status_code == 200
+        assert response.data["created"] == 1
+
+        response = self.post_import()
+        assert response.status_code == 400
+        assert ExampleModel.objects.count() == 1
+
+    @override_settings(
+        EXTENSIBLE_MODELS_SCHEMA_RESOLVER="tests.test_resolvers.HeaderTenantResolver"
+    )
+    def test_import_view_uses_schema_resolver(self):
+        response = self.post_import(HTTP_X_TENANT=str(self.tenant.pk))
+        assert response.status_code == 200
+        assert ExampleModel.objects.get().tenant == self.tenant
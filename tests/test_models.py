@@ -1,11 +1,20 @@
 import pytest
 
+from io import StringIO
+
+from django.db import transaction
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
+from django.core.management import call_command
 
-from extensible_models.models import ExtensionSchema, ExtensibleModelMixin
+from extensible_models.models import (
+    ActiveExtensionSchema,
+    ConcurrentUpdateError,
+    ExtensionSchema,
+    ExtensibleModelMixin,
+)
 from .models import Tenant, ExampleModel
 
 pytestmark = pytest.mark.django_db
@@ -268,3 +277,170 @@ class TestExtensibleModel(TestCase):
         )
         assert "parent_field" in child_model.extended_fields
         assert "child_field" in child_model.extended_fields
+
+    def test_schema_hash_shared_across_tenants(self):
+        schema = {"type": "object", "properties": {"field1": {"type": "string"}}}
+        schema1 = ExtensionSchema.objects.create(
+            tenant=self.tenant1, content_type=self.content_type, schema=schema
+        )
+        schema2 = schema1.copy_to_tenant(self.tenant2)
+        assert schema2.tenant == self.tenant2
+        assert schema2.version == 1
+        assert schema1.schema_hash == schema2.schema_hash
+        assert schema1.compiled is schema2.compiled
+
+    def test_unchanged_schema_keeps_version(self):
+        schema = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field1": {"type": "string"}}},
+        )
+        schema.save()
+        assert schema.version == 1
+        schema.schema = {"type": "object", "properties": {"field2": {"type": "string"}}}
+        schema.save()
+        assert schema.version == 2
+
+    def test_update_extended_merges_concurrent_changes(self):
+        model = ExampleModel.objects.create(
+            name="Model", tenant=self.tenant1, extended_data={"a": 1}
+        )
+        first = ExampleModel.objects.get(pk=model.pk)
+        second = ExampleModel.objects.get(pk=model.pk)
+        first.update_extended({"b": 2})
+        second.update_extended({"c": 3}, remove=["a"])
+        model.refresh_from_db()
+        assert model.extended_data == {"b": 2, "c": 3}
+        assert model.extended_revision == 2
+
+    def test_update_extended_expected_revision(self):
+        model = ExampleModel.objects.create(
+            name="Model", tenant=self.tenant1, extended_data={"a": 1}
+        )
+        stale = ExampleModel.objects.get(pk=model.pk)
+        model.update_extended({"a": 2})
+        with pytest.raises(ConcurrentUpdateError):
+            stale.update_extended({"a": 3}, expected_revision=stale.extended_revision)
+        model.refresh_from_db()
+        assert model.extended_data == {"a": 2}
+
+    def test_save_resolves_schema_once(self):
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"a": {"type": "integer"}}},
+        )
+        model = ExampleModel.objects.create(
+            name="Model", tenant=self.tenant1, extended_data={"a": 1}
+        )
+        model.extended_data["a"] = 2
+        # The schema lookup made by clean(), and the UPDATE
+        with self.assertNumQueries(2):
+            model.save()
+        assert model.extended_schema_version == 1
+
+    def test_stale_save_does_not_overwrite_newer_data(self):
+        model = ExampleModel.objects.create(
+            name="Model", tenant=self.tenant1, extended_data={"a": 1}
+        )
+        stale = ExampleModel.objects.get(pk=model.pk)
+        for n in range(3):
+            model.update_extended({"n": n})
+        stale.extended_data["a"] = 2
+        with pytest.raises(ConcurrentUpdateError), transaction.atomic():
+            stale.save()
+        assert stale.extended_revision == 0
+        model.refresh_from_db()
+        assert model.extended_data == {"a": 1, "n": 2}
+        assert model.extended_revision == 3
+
+        model.extended_data["a"] = 3
+        model.save()
+        assert model.extended_revision == 4
+        model.refresh_from_db()
+        assert model.extended_data == {"a": 3, "n": 2}
+        assert model.extended_revision == 4
+
+    def test_staged_schema_is_activated_explicitly(self):
+        v1 = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field1": {"type": "string"}}},
+        )
+        v2 = ExtensionSchema(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field2": {"type": "string"}}},
+        )
+        v2.save(activate=False)
+        assert v2.version == 2
+        assert ExampleModel.get_latest_schema(self.tenant1) == v1
+
+        v2.activate()
+        with self.assertNumQueries(1):
+            assert ExampleModel.get_latest_schema(self.tenant1) == v2
+
+        v2.delete()
+        assert ExampleModel.get_latest_schema(self.tenant1) == v1
+
+    def test_queryset_delete_reactivates_remaining_version(self):
+        v1 = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field1": {"type": "string"}}},
+        )
+        v2 = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field2": {"type": "string"}}},
+        )
+        assert ExampleModel.get_latest_schema(self.tenant1) == v2
+        assert ExampleModel.get_schema_version(self.tenant1, 2) == v2
+
+        ExtensionSchema.objects.filter(pk=v2.pk).delete()
+        assert ExampleModel.get_latest_schema(self.tenant1) == v1
+        assert ExampleModel.get_schema_version(self.tenant1, 2) is None
+
+        # Deleting every version leaves no active schema
+        ExtensionSchema.objects.filter(tenant=self.tenant1).delete()
+        assert ExampleModel.get_latest_schema(self.tenant1) is None
+
+    def test_activate_extension_schemas_command(self):
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field1": {"type": "string"}}},
+        )
+        v2 = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"field2": {"type": "string"}}},
+        )
+        ActiveExtensionSchema.objects.all().delete()
+        assert ExampleModel.get_latest_schema(self.tenant1) is None
+
+        call_command("activate_extension_schemas", stdout=StringIO())
+        assert ExampleModel.get_latest_schema(self.tenant1) == v2
+
+    def test_schema_version_recorded_on_write(self):
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"a": {"type": "integer"}}},
+        )
+        model = ExampleModel.objects.create(
+            name="Model", tenant=self.tenant1, extended_data={"a": 1}
+        )
+        assert model.extended_schema_version == 1
+        v2 = ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"b": {"type": "integer"}}},
+        )
+        model = ExampleModel.objects.get(pk=model.pk)
+        assert model.get_stored_schema().version == 1
+
+        model.update_extended({"b": 2})
+        model.refresh_from_db()
+        assert model.extended_schema_version == 2
+        assert model.get_stored_schema() == v2
@@ -0,0 +1,67 @@
+import pytest
+
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase, TestCase
+
+from extensible_models.models import ExtensionSchema
+from extensible_models.profiling import profile_validation
+from extensible_models.schemas import compile_schema
+from extensible_models.utils import validate_extended_data
+from .models import Tenant, ExampleModel
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "code": {"type": "string", "pattern": "^[A-Z]{3}-[0-9]+$"},
+        "status": {"type": "string", "enum": ["open", "closed"]},
+    },
+}
+
+
+class TestValidationProfile(SimpleTestCase):
+
+    def test_records_time_per_pointer_and_keyword(self):
+        with profile_validation() as profile:
+            for _ in range(3):
+                validate_extended_data({"code": "ABC-1", "status": "open"}, SCHEMA)
+            with pytest.raises(ValidationError):
+                validate_extended_data({"code": "abc"}, SCHEMA)
+
+        entries = {
+            (entry["pointer"], entry["keyword"]): entry
+            for entry in profile.report(schema_hash=compile_schema(SCHEMA).hash)
+        }
+        assert entries[("#/properties/code", "pattern")]["calls"] == 4
+        assert entries[("#/properties/status", "enum")]["calls"] == 3
+        assert entries[("#", "properties")]["total"] > 0
+
+    def test_profiling_is_scoped_to_block(self):
+        with profile_validation() as profile:
+            pass
+        validate_extended_data({"code": "ABC-1"}, SCHEMA)
+        assert profile.report() == []
+
+
+@pytest.mark.django_db
+class TestProfileCommand(TestCase):
+
+    def test_command_reports_entries(self):
+        tenant = Tenant.objects.create(name="Tenant 1")
+        ExtensionSchema.objects.create(
+            tenant=tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema=SCHEMA,
+        )
+        ExampleModel.objects.create(
+            name="Model", tenant=tenant, extended_data={"code": "ABC-1"}
+        )
+        out = StringIO()
+        call_command(
+            "profile_extension_schema", "tests.ExampleModel", tenant.pk, stdout=out
+        )
+        assert "Validated 1 rows (0 invalid)" in out.getvalue()
+        assert "#/properties/code [pattern]" in out.getvalue()
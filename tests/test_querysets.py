@@ -0,0 +1,128 @@
+import pytest
+
+from django.core.exceptions import FieldError
+from django.db.models import Count, Q, Sum, Avg
+from django.test import TestCase, TransactionTestCase
+from django.contrib.contenttypes.models import ContentType
+
+from extensible_models.indexes import create_tenant_indexes, drop_tenant_indexes
+from extensible_models.models import ExtensionSchema
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+
+class TestExtendedAggregation(TestCase):
+
+    def setUp(self):
+        self.tenant1 = Tenant.objects.create(name="Tenant 1")
+        self.tenant2 = Tenant.objects.create(name="Tenant 2")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string"},
+                    "amount": {"type": "number"},
+                    "quantity": {"type": "integer"},
+                },
+            },
+        )
+        for status, amount, quantity in [
+            ("open", 1.5, 1),
+            ("open", 2.5, 2),
+            ("closed", 10, 3),
+        ]:
+            ExampleModel.objects.create(
+                name=status,
+                tenant=self.tenant1,
+                extended_data={
+                    "status": status,
+                    "amount": amount,
+                    "quantity": quantity,
+                },
+            )
+        ExampleModel.objects.create(
+            name="other", tenant=self.tenant2, extended_data={"amount": 100}
+        )
+
+    def test_aggregate_extended(self):
+        result = ExampleModel.objects.for_tenant(self.tenant1).aggregate_extended(
+            total=Sum("amount"), average=Avg("quantity")
+        )
+        assert result == {"total": 14.0, "average": 2.0}
+
+    def test_values_extended_group_by(self):
+        rows = (
+            ExampleModel.objects.for_tenant(self.tenant1)
+            .values_extended("status")
+            .annotate_extended(count=Count("pk"), total=Sum("amount"))
+            .order_by("status")
+        )
+        assert list(rows) == [
+            {"status": "closed", "count": 1, "total": 10.0},
+            {"status": "open", "count": 2, "total": 4.0},
+        ]
+
+    def test_unknown_extended_key(self):
+        with pytest.raises(FieldError):
+            ExampleModel.objects.for_tenant(self.tenant1).aggregate_extended(
+                total=Sum("missing")
+            )
+
+    def test_requires_tenant(self):
+        with pytest.raises(FieldError):
+            ExampleModel.objects.aggregate_extended(total=Sum("amount"))
+
+
+class TenantScopedFixture:
+
+    def setUp(self):
+        self.tenant1 = Tenant.objects.create(name="Tenant 1")
+        self.tenant2 = Tenant.objects.create(name="Tenant 2")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant1,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string"},
+                    "tags": {"type": "array"},
+                },
+            },
+        )
+        for tenant in (self.tenant1, self.tenant2):
+            ExampleModel.objects.create(
+                name=tenant.name, tenant=tenant, extended_data={"status": "open"}
+            )
+
+
+class TestTenantScopedManager(TenantScopedFixture, TestCase):
+
+    def test_objects_remains_the_default_manager(self):
+        assert ExampleModel._default_manager is ExampleModel.objects
+
+    def test_extended_filters_are_scoped_to_the_tenant(self):
+        queryset = ExampleModel.extended.for_tenant(self.tenant1)
+        rows = queryset.filter(extended_data__status="open")
+        assert [obj.name for obj in rows] == ["Tenant 1"]
+        assert not queryset.exclude(Q(name="x") | Q(extended_data__status="open"))
+
+    def test_extended_filters_require_tenant(self):
+        with pytest.raises(FieldError):
+            ExampleModel.extended.filter(extended_data__status="open")
+        with pytest.raises(FieldError):
+            ExampleModel.extended.exclude(Q(name="x") | Q(extended_data__status="x"))
+        assert ExampleModel.extended.filter(name="Tenant 2").count() == 1
+
+
+class TestTenantIndexes(TenantScopedFixture, TransactionTestCase):
+    # Schema changes cannot run inside TestCase's transaction on SQLite
+
+    def test_tenant_indexes(self):
+        created = create_tenant_indexes(ExampleModel, self.tenant1)
+        # Only scalar properties are indexed, and only once
+        assert len(created) == 1
+        assert create_tenant_indexes(ExampleModel, self.tenant1) == []
+        assert drop_tenant_indexes(ExampleModel, self.tenant1) == created
@@ -0,0 +1,92 @@
+import pytest
+
+from django import forms
+from django.contrib.contenttypes.models import ContentType
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework import serializers
+
+from extensible_models.forms import ExtensibleModelFormMixin
+from extensible_models.models import ExtensionSchema
+from extensible_models.resolvers import (
+    SchemaResolutionMiddleware,
+    SchemaResolver,
+    get_current_tenant,
+    resolved,
+)
+from extensible_models.serializers import ExtensibleModelSerializerMixin
+from .models import Tenant, ExampleModel, OtherModel
+
+pytestmark = pytest.mark.django_db
+
+
+class ExampleForm(ExtensibleModelFormMixin, forms.ModelForm):
+    class Meta:
+        model = ExampleModel
+        fields = ["name"]
+
+
+class ExampleSerializer(ExtensibleModelSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ExampleModel
+        fields = ["id", "name"]
+
+
+class HeaderTenantResolver(SchemaResolver):
+    def get_tenant(self, request):
+        tenant_id = request.headers.get("X-Tenant")
+        return Tenant.objects.get(pk=tenant_id) if tenant_id else None
+
+
+class TestSchemaResolution(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        self.content_type = ContentType.objects.get_for_model(ExampleModel)
+        self.schema = ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=self.content_type,
+            schema={"type": "object", "properties": {"status": {"type": "string"}}},
+        )
+        self.request = RequestFactory().get("/")
+        self.request.tenant = self.tenant
+
+    def test_middleware_primes_schemas(self):
+        def view(request):
+            with self.assertNumQueries(0):
+                assert get_current_tenant() == self.tenant
+                assert ExampleModel.get_latest_schema(self.tenant) == self.schema
+                assert OtherModel.get_latest_schema(self.tenant) is None
+                form = ExampleForm()
+                serializer = ExampleSerializer(context={"request": request})
+            assert "status" in form.fields
+            assert serializer.extension_schema == self.schema
+            return HttpResponse()
+
+        SchemaResolutionMiddleware(view)(self.request)
+        assert get_current_tenant() is None
+
+    def test_other_tenants_are_looked_up(self):
+        other = Tenant.objects.create(name="Other")
+        with resolved(self.request):
+            with self.assertNumQueries(1):
+                assert ExampleModel.get_latest_schema(other) is None
+
+    def test_activation_discards_resolved_schema(self):
+        with resolved(self.request):
+            schema = ExtensionSchema.objects.create(
+                tenant=self.tenant,
+                content_type=self.content_type,
+                schema={"type": "object", "properties": {"other": {"type": "string"}}},
+            )
+            assert ExampleModel.get_latest_schema(self.tenant) == schema
+
+    @override_settings(
+        EXTENSIBLE_MODELS_SCHEMA_RESOLVER="tests.test_resolvers.HeaderTenantResolver"
+    )
+    def test_custom_resolver(self):
+        request = RequestFactory().get("/", HTTP_X_TENANT=str(self.tenant.pk))
+        with resolved(request) as resolution:
+            assert resolution.tenant == self.tenant
+            with self.assertNumQueries(0):
+                assert ExampleModel.get_latest_schema(self.tenant) == self.schema
@@ -0,0 +1,66 @@
+import pytest
+
+from django.test import SimpleTestCase
+
+from extensible_models.schemas import (
+    CompiledSchema,
+    PropertySpec,
+    compile_schema,
+    schema_hash,
+)
+
+
+class TestCompiledSchema(SimpleTestCase):
+
+    def setUp(self):
+        self.schema = {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "enum": ["open", "closed"]},
+                "amount": {"type": "number", "minimum": 0},
+            },
+            "required": ["status"],
+        }
+
+    def test_schema_hash_ignores_key_order(self):
+        reordered = {
+            "required": ["status"],
+            "properties": {
+                "amount": {"minimum": 0, "type": "number"},
+                "status": {"enum": ["open", "closed"], "type": "string"},
+            },
+            "type": "object",
+        }
+        assert schema_hash(self.schema) == schema_hash(reordered)
+
+    def test_identical_schemas_share_compiled_object(self):
+        copy = {
+            "type": "object",
+            "properties": dict(self.schema["properties"]),
+            "required": ["status"],
+        }
+        assert compile_schema(self.schema) is compile_schema(copy)
+
+    def test_property_specs(self):
+        compiled = compile_schema(self.schema)
+        status = compiled.properties["status"]
+        assert isinstance(status, PropertySpec)
+        assert status.required
+        assert status.enum == ("open", "closed")
+        assert status.get("type") == "string"
+        assert not compiled.properties["amount"].required
+        assert compiled.properties["amount"].minimum == 0
+
+    def test_compiled_schema_is_immutable(self):
+        compiled = compile_schema(self.schema)
+        with pytest.raises(AttributeError):
+            compiled.hash = "other"
+        with pytest.raises(TypeError):
+            compiled.properties["new"] = None
+        with pytest.raises(TypeError):
+            compiled.schema["properties"]["status"]["type"] = "number"
+
+    def test_to_dict_round_trips(self):
+        compiled = compile_schema(self.schema)
+        assert isinstance(compiled, CompiledSchema)
+        assert compiled.to_dict() == self.schema
@@ -0,0 +1,251 @@
+import pytest
+
+from django.test import TestCase, RequestFactory, override_settings
+from django.contrib.contenttypes.models import ContentType
+from rest_framework import serializers
+from rest_framework.request import Request
+
+from extensible_models.models import ExtensionSchema
+from extensible_models.serializers import (
+    ExtensibleListSerializer,
+    ExtensibleModelSerializerMixin,
+    get_field_plan,
+)
+from .models import Tenant, ExampleModel
+
+pytestmark = pytest.mark.django_db
+
+
+class ExampleSerializer(ExtensibleModelSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ExampleModel
+        fields = ["id", "name", "tenant"]
+
+
+class CachedExampleSerializer(ExampleSerializer):
+    cache_representation = True
+
+
+class TestExtensibleModelSerializer(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        self.schema = ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string", "enum": ["open", "closed"]},
+                    "amount": {"type": "number"},
+                    "due": {"type": "string", "format": "date"},
+                },
+                "required": ["status"],
+            },
+        )
+        self.obj = ExampleModel.objects.create(
+            name="a",
+            tenant=self.tenant,
+            extended_data={"status": "open", "amount": 2.5, "due": "2024-01-02"},
+        )
+
+    def get_request(self, path="/", method="get"):
+        request = Request(getattr(RequestFactory(), method)(path))
+        request.tenant = self.tenant
+        return request
+
+    def test_field_plan_is_cached_per_version(self):
+        plan = get_field_plan(self.schema.compiled)
+        assert get_field_plan(self.schema.compiled) is plan
+        assert plan["status"][0] is serializers.ChoiceField
+        assert plan["status"][1]["required"]
+        assert plan["due"][0] is serializers.DateField
+
+    def test_all_fields_by_default(self):
+        serializer = ExampleSerializer(
+            self.obj, context={"request": self.get_request()}
+        )
+        assert set(serializer.data) == {
+            "id",
+            "name",
+            "tenant",
+            "status",
+            "amount",
+            "due",
+        }
+        assert isinstance(serializer.fields["amount"], serializers.FloatField)
+
+    def test_sparse_fieldset_query_parameter(self):
+        request = self.get_request("/?fields=name,status")
+        serializer = ExampleSerializer(
+            ExampleModel.objects.all(), many=True, context={"request": request}
+        )
+        assert serializer.data == [{"name": "a", "status": "open"}]
+        assert set(serializer.child.fields) == {"name", "status"}
+
+    def test_sparse_fieldset_argument(self):
+        serializer = ExampleSerializer(
+            self.obj, fields=["id", "amount"], context={"request": self.get_request()}
+        )
+        assert serializer.data == {"id": self.obj.pk, "amount": 2.5}
+
+    def test_sparse_fieldset_ignored_on_writes(self):
+        request = self.get_request("/?fields=name", method="post")
+        serializer = ExampleSerializer(
+            data={"name": "b", "tenant": self.tenant.pk, "status": "closed"},
+            context={"request": request},
+        )
+        assert serializer.is_valid(), serializer.errors
+        assert "status" in serializer.fields
+
+    def test_stale_revision_rolls_back_model_fields(self):
+        stale_revision = self.obj.extended_revision
+        ExampleModel.objects.get(pk=self.obj.pk).update_extended({"amount": 3})
+        serializer = ExampleSerializer(
+            self.obj,
+            data={
+                "name": "b",
+                "status": "closed",
+                "extended_revision": stale_revision,
+            },
+            partial=True,
+            context={"request": self.get_request(method="patch")},
+        )
+        assert serializer.is_valid(), serializer.errors
+        with pytest.raises(serializers.ValidationError) as excinfo:
+            serializer.save()
+        assert "extended_revision" in excinfo.value.detail
+        self.obj.refresh_from_db()
+        assert self.obj.name == "a"
+        assert self.obj.extended_data["status"] == "open"
+
+    def test_rows_render_the_fields_of_their_schema_version(self):
+        assert self.obj.extended_schema_version == 1
+        v2 = ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=self.schema.content_type,
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string", "enum": ["open", "closed"]},
+                    "priority": {"type": "integer"},
+                },
+            },
+        )
+        ExampleModel.objects.create(
+            name="b", tenant=self.tenant, extended_data={"priority": 1}
+        )
+        serializer = ExampleSerializer(
+            ExampleModel.objects.order_by("name"),
+            many=True,
+            context={"request": self.get_request()},
+        )
+        with self.assertNumQueries(2):
+            data = serializer.data
+        assert data[0] == {
+            "id": self.obj.pk,
+            "name": "a",
+            "tenant": self.tenant.pk,
+            "status": "open",
+            "amount": 2.5,
+            "due": "2024-01-02",
+        }
+        assert data[1]["priority"] == 1
+        assert "amount" not in data[1]
+        assert ExampleModel.objects.get(name="b").get_stored_schema() == v2
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "representations": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "representations",
+        },
+    },
+    EXTENSIBLE_MODELS_REPRESENTATION_CACHE="representations",
+)
+class TestRepresentationCache(TestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Tenant")
+        ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={"type": "object", "properties": {"status": {"type": "string"}}},
+        )
+        self.obj = ExampleModel.objects.create(
+            name="a", tenant=self.tenant, extended_data={"status": "open"}
+        )
+        self.context = {"request": Request(RequestFactory().get("/"))}
+        self.context["request"].tenant = self.tenant
+
+    def tearDown(self):
+        from django.core.cache import caches
+
+        caches["representations"].clear()
+
+    def render(self, serializer_class=CachedExampleSerializer):
+        obj = ExampleModel.objects.get(pk=self.obj.pk)
+        return serializer_class(obj, context=self.context).data
+
+    def test_cached_representation_is_reused(self):
+        assert self.render()["name"] == "a"
+        ExampleModel.objects.filter(pk=self.obj.pk).update(name="b")
+        assert self.render()["name"] == "a"
+        # Serializers that do not opt in are unaffected
+        assert self.render(ExampleSerializer)["name"] == "b"
+
+    def test_save_invalidates_on_commit(self):
+        self.render()
+        obj = ExampleModel.objects.get(pk=self.obj.pk)
+        obj.name = "b"
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(1):
+                obj.save()
+        assert len(callbacks) == 1
+        assert self.render()["name"] == "b"
+
+    def test_update_extended_invalidates(self):
+        self.render()
+        obj = ExampleModel.objects.get(pk=self.obj.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.update_extended({"status": "closed"})
+        assert self.render()["status"] == "closed"
+
+    def test_rows_of_older_versions_are_not_cached(self):
+        ExtensionSchema.objects.create(
+            tenant=self.tenant,
+            content_type=ContentType.objects.get_for_model(ExampleModel),
+            schema={
+                "type": "object",
+                "properties": {
+                    "status": {"type": "string"},
+                    "size": {"type": "integer"},
+                },
+            },
+        )
+        self.render()
+        ExampleModel.objects.filter(pk=self.obj.pk).update(name="b")
+        assert self.render()["name"] == "b"
+
+    def test_sparse_fieldsets_bypass_the_cache(self):
+        self.render()
+        serializer = CachedExampleSerializer(
+            self.obj, fields=["status"], context=self.context
+        )
+        assert serializer.data == {"status": "open"}
+
+    def test_list_reads_cached_representations_in_bulk(self):
+        ExampleModel.objects.create(
+            name="c", tenant=self.tenant, extended_data={"status": "closed"}
+        )
+        self.render()
+        ExampleModel.objects.filter(pk=self.obj.pk).update(name="b")
+        serializer = CachedExampleSerializer(
+            ExampleModel.objects.order_by("pk"), many=True, context=self.context
+        )
+        data = serializer.data
+        assert [item["name"] for item in data] == ["a", "c"]
+        assert data[1]["status"] == "closed"
+        assert isinstance(serializer, ExtensibleListSerializer)
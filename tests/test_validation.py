@@ -0,0 +1,182 @@
+import pytest
+import jsonschema
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from extensible_models import validation
+from extensible_models.utils import validate_extended_changes, validate_extended_data
+from extensible_models.validation import (
+    get_fast_validator,
+    validate_batch,
+    validate_many,
+)
+
+SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "title": "Example",
+    "properties": {
+        "name": {"type": "string", "minLength": 2, "maxLength": 5},
+        "code": {"type": "string", "pattern": "^[A-Z]+$"},
+        "status": {"type": "string", "enum": ["open", "closed"]},
+        "level": {"enum": [1, 2.5, True, None]},
+        "count": {"type": "integer", "minimum": 0, "maximum": 10},
+        "ratio": {"type": "number", "exclusiveMinimum": 0, "exclusiveMaximum": 1},
+        "flag": {"type": "boolean"},
+        "due": {"type": "string", "format": "date"},
+        "tags": {
+            "type": "array",
+            "items": {"type": "string", "enum": ["a", "b"]},
+            "minItems": 1,
+            "maxItems": 2,
+        },
+        "anything": {},
+    },
+    "required": ["name"],
+}
+
+VALUES = [
+    None,
+    True,
+    False,
+    0,
+    1,
+    1.0,
+    2.5,
+    11,
+    -1,
+    0.5,
+    "",
+    "a",
+    "ab",
+    "ABC",
+    "abcdef",
+    "open",
+    "closed",
+    "2024-13-45",
+    [],
+    ["a"],
+    ["a", "b", "a"],
+    ["c"],
+    [1],
+    {},
+    {"a": 1},
+]
+
+
+class TestFastValidator(SimpleTestCase):
+
+    def test_matches_jsonschema(self):
+        is_valid = get_fast_validator(SCHEMA)
+        validator = jsonschema.Draft7Validator(SCHEMA)
+        for name in SCHEMA["properties"]:
+            for value in VALUES:
+                instance = {"name": "abc", name: value}
+                assert is_valid(instance) == validator.is_valid(instance), (
+                    name,
+                    value,
+                )
+        assert not is_valid({})
+        assert get_fast_validator(SCHEMA, is_creation=True)({})
+
+    def test_unsupported_schemas_fall_back(self):
+        for schema in [
+            {"type": "object", "additionalProperties": False},
+            {"type": "object", "properties": {"a": {"type": ["string", "null"]}}},
+            {"type": "object", "properties": {"a": {"anyOf": [{"type": "string"}]}}},
+            {"type": "object", "properties": {"a": {"enum": [[1, 2]]}}},
+            {"$schema": "http://json-schema.org/draft-04/schema#"},
+        ]:
+            assert get_fast_validator(schema) is None
+
+    def test_error_messages_come_from_jsonschema(self):
+        with pytest.raises(ValidationError) as excinfo:
+            validate_extended_data({"name": "abc", "count": 11}, SCHEMA)
+        assert "11 is greater than the maximum of 10" in str(excinfo.value)
+
+
+class TestValidateBatch(SimpleTestCase):
+
+    def instances(self):
+        instances = [
+            {"name": "abc", name: value}
+            for name in SCHEMA["properties"]
+            for value in VALUES
+        ]
+        # Long numeric columns, so ranges are checked with NumPy if present
+        instances += [{"name": "abc", "count": n % 13 - 1} for n in range(200)]
+        instances += [{"name": "abc", "ratio": n / 100} for n in range(-20, 120)]
+        instances += [{}, {"count": 2**60}]
+        return instances
+
+    def expected(self, instances, schema=SCHEMA):
+        validator = jsonschema.Draft7Validator(schema)
+        return {
+            index
+            for index, instance in enumerate(instances)
+            if not validator.is_valid(instance)
+        }
+
+    def test_matches_jsonschema(self):
+        instances = self.instances()
+        errors = validate_batch(instances, SCHEMA)
+        assert set(errors) == self.expected(instances)
+
+    def test_matches_jsonschema_without_numpy(self):
+        instances = self.instances()
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(validation, "numpy", None)
+            errors = validate_batch(instances, SCHEMA)
+        assert set(errors) == self.expected(instances)
+
+    def test_unsupported_schema_falls_back(self):
+        schema = {"type": "object", "additionalProperties": False}
+        errors = validate_batch([{}, {"a": 1}], schema)
+        assert list(errors) == [1]
+
+    def test_reports_error_messages(self):
+        errors = validate_batch([{"name": "abc"}, {"name": "abc", "count": 11}], SCHEMA)
+        assert errors == {1: ["11 is greater than the maximum of 10"]}
+        assert validate_batch([{}], SCHEMA, is_creation=True) == {}
+
+
+class TestValidateExtendedChanges(SimpleTestCase):
+
+    def test_matches_jsonschema(self):
+        validator = jsonschema.Draft7Validator(SCHEMA)
+        for name in SCHEMA["properties"]:
+            for value in VALUES:
+                expected = validator.is_valid({"name": "abc", name: value})
+                if expected:
+                    assert validate_extended_changes({name: value}, (), SCHEMA)
+                else:
+                    with pytest.raises(ValidationError):
+                        validate_extended_changes({name: value}, (), SCHEMA)
+
+    def test_untouched_required_keys_are_not_checked(self):
+        assert validate_extended_changes({"count": 1}, ["status"], SCHEMA)
+        with pytest.raises(ValidationError, match="'name' is a required property"):
+            validate_extended_changes({}, ["name"], SCHEMA)
+
+    def test_reports_property_error(self):
+        with pytest.raises(ValidationError, match="11 is greater than the maximum"):
+            validate_extended_changes({"count": 11}, (), SCHEMA)
+
+    def test_unsupported_schema_is_not_validated(self):
+        schema = {"type": "object", "additionalProperties": False}
+        assert not validate_extended_changes({"a": 1}, (), schema)
+
+
+class TestValidateMany(SimpleTestCase):
+
+    def test_yields_errors_in_order(self):
+        instances = [{"name": "abc", "count": n % 13 - 1} for n in range(100)]
+        validator = jsonschema.Draft7Validator(SCHEMA)
+        expected = [[e.message for e in validator.iter_errors(i)] for i in instances]
+        for workers in (1, 2):
+            results = validate_many(
+                iter(instances), SCHEMA, workers=workers, chunk_size=7
+            )
+            assert list(results) == expected
+        assert any(expected)